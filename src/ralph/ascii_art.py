@@ -3,11 +3,12 @@
 
 import argparse
 import os
+from functools import lru_cache
 from pathlib import Path
 
 from PIL import Image
 from rich.console import Console
-from rich.text import Text
+from rich.text import Span, Text
 
 console = Console()
 
@@ -65,44 +66,58 @@ def adjust_contrast(image, factor=1.5):
         image = grayify(image)
 
     # Get the minimum and maximum pixel values
-    pixels = list(image.getdata())
-    min_val = min(pixels)
-    max_val = max(pixels)
+    min_val, max_val = image.getextrema()
 
     # Calculate contrast adjustment factors
     range_val = max_val - min_val
     if range_val == 0:  # Avoid division by zero
         return image
 
-    # Create a new image with adjusted contrast
-    result = Image.new("L", image.size)
-    width, height = image.size
+    # Build a 256-entry lookup table and let Pillow apply it to every pixel
+    lut = []
+    for pixel in range(256):
+        # Normalize the pixel value to [0, 1]
+        normalized = (pixel - min_val) / range_val
 
-    for y in range(height):
-        for x in range(width):
-            pixel = image.getpixel((x, y))
+        # Apply contrast adjustment
+        adjusted = ((normalized - 0.5) * factor + 0.5) * 255
 
-            # Normalize the pixel value to [0, 1]
-            normalized = (pixel - min_val) / range_val
+        # Clamp to valid range
+        lut.append(max(0, min(255, int(adjusted))))
 
-            # Apply contrast adjustment
-            adjusted = ((normalized - 0.5) * factor + 0.5) * 255
+    return image.point(lut)
 
-            # Clamp to valid range
-            adjusted = max(0, min(255, int(adjusted)))
 
-            result.putpixel((x, y), adjusted)
+@lru_cache(maxsize=16)
+def _ascii_table(chars: str, min_val: int, max_val: int) -> bytes:
+    """Build the grey-level to character translation table for bytes.translate."""
+    val_range = max_val - min_val
+
+    # If all pixels are the same, avoid division by zero
+    if val_range == 0:
+        val_range = 1
+
+    # Map each grey level to an ASCII character with improved scaling
+    last_idx = len(chars) - 1
+    table = bytearray(256)
+    for pixel in range(min_val, max_val + 1):
+        # Normalize pixel value to [0, 1] based on the image's actual range
+        normalized = (pixel - min_val) / val_range
 
-    return result
+        # Map to ASCII character index
+        char_idx = min(int(normalized * last_idx), last_idx)
+        table[pixel] = ord(chars[char_idx])
+    return bytes(table)
 
 
 # Function to map pixels to ASCII
-def pixel_to_ascii(image):
+def pixel_to_ascii(image, chars=ASCII_CHARS):
     """
     Convert a grayscale image to ASCII characters.
 
     Args:
         image: A grayscale (mode 'L') PIL image
+        chars: Character ramp to map grey levels onto (dark to light pixels)
 
     Returns:
         A string of ASCII characters representing the image
@@ -111,29 +126,11 @@ def pixel_to_ascii(image):
     if image.mode != "L":
         image = image.convert("L")
 
-    # Get pixel data
-    pixels = list(image.getdata())
-
     # Find min and max for better mapping
-    min_val = min(pixels)
-    max_val = max(pixels)
-    val_range = max_val - min_val
+    min_val, max_val = image.getextrema()
 
-    # If all pixels are the same, avoid division by zero
-    if val_range == 0:
-        val_range = 1
-
-    # Map pixels to ASCII characters with improved scaling
-    ascii_str = ""
-    for pixel in pixels:
-        # Normalize pixel value to [0, 1] based on the image's actual range
-        normalized = (pixel - min_val) / val_range
-
-        # Map to ASCII character index
-        char_idx = min(int(normalized * (len(ASCII_CHARS) - 1)), len(ASCII_CHARS) - 1)
-        ascii_str += ASCII_CHARS[char_idx]
-
-    return ascii_str
+    # Translate the raw pixel bytes in one pass
+    return image.tobytes().translate(_ascii_table(chars, min_val, max_val)).decode("ascii")
 
 
 # Function to resize image maintaining aspect ratio, adjusted for terminal width and height
@@ -146,7 +143,8 @@ def resize_image(image, max_width, max_height, char_aspect_ratio):
         new_height = max_height
         new_width = int(max_height * aspect_ratio / char_aspect_ratio)
 
-    resized_image = image.resize((new_width, new_height))
+    # Output is a few thousand characters at most, so bilinear is plenty
+    resized_image = image.resize((new_width, new_height), Image.Resampling.BILINEAR)
     return resized_image
 
 
@@ -159,24 +157,13 @@ def grayify(image):
     if image.mode == "L":
         return image
 
-    width, height = image.size
-    result = Image.new("L", (width, height))
-
-    # Process each pixel
-    for x in range(width):
-        for y in range(height):
-            # Get RGB values
-            r, g, b = image.getpixel((x, y))[
-                :3
-            ]  # Ensure we get only RGB if there's alpha
+    # Drop alpha/palette so the matrix conversion sees plain RGB
+    if image.mode != "RGB":
+        image = image.convert("RGB")
 
-            # Apply luma weighted sum formula
-            luma = int(0.2126 * r + 0.7152 * g + 0.0722 * b)
-
-            # Set the grayscale pixel
-            result.putpixel((x, y), luma)
-
-    return result
+    # Pillow applies the weighted sum in C; the -0.5 offset cancels its rounding
+    # so values truncate the same way int() does
+    return image.convert("L", (0.2126, 0.7152, 0.0722, -0.5))
 
 
 # Function to create an image with a circle for aspect ratio calibration
@@ -186,17 +173,21 @@ def create_circle_ascii_image(max_width, max_height, char_aspect_ratio):
     radius = min(max_width // 2, height_aspect_ratio_adjusted // 2)
     center_x, center_y = max_width // 2, max_height // 2
 
+    # Each row of a circle is one run of '@' centred on center_x: widen it
+    # while the next cell still passes the per-cell distance test
     for y in range(max_height):
-        line = ""
-        for x in range(max_width):
-            distance = (
-                ((x - center_x) ** 2) + ((y - center_y) ** 2) / (char_aspect_ratio**2)
-            ) ** 0.5
-            if distance < radius:
-                line += "@"
-            else:
-                line += " "
-        circle_ascii.append(line)
+        dy2 = ((y - center_y) ** 2) / (char_aspect_ratio**2)
+        if dy2**0.5 >= radius:
+            circle_ascii.append(" " * max_width)
+            continue
+
+        half = 0
+        while half < center_x and ((half + 1) ** 2 + dy2) ** 0.5 < radius:
+            half += 1
+
+        left = center_x - half
+        right = min(max_width, center_x + half + 1)
+        circle_ascii.append(" " * left + "@" * (right - left) + " " * (max_width - right))
     return "\n".join(circle_ascii)
 
 
@@ -222,8 +213,7 @@ def display_ascii_image(
             terminal_height = max_height if max_height else 24
 
         # Set the appropriate character set based on dark mode preference
-        global ASCII_CHARS
-        ASCII_CHARS = DARK_MODE_CHARS if dark_mode else LIGHT_MODE_CHARS
+        ascii_chars = DARK_MODE_CHARS if dark_mode else LIGHT_MODE_CHARS
 
         if not (circle or image_path):
             console.print(
@@ -242,6 +232,7 @@ def display_ascii_image(
                 terminal_width, terminal_height, char_aspect_ratio
             )
 
+            rows = []
             for line in ascii_img.splitlines():
                 colored_line = Text()
                 # Adjust color based on dark mode
@@ -255,13 +246,21 @@ def display_ascii_image(
                         colored_line.append(
                             char, style="white" if char == "@" else "black"
                         )
-                console.print(colored_line)
+                rows.append(colored_line)
+            # Render and write the whole picture in one call
+            console.print(Text("\n").join(rows))
         else:
             # Open and process the image
             image = Image.open(image_path)
+            # Let the JPEG decoder downscale while decoding; no-op for other formats
+            image.draft("RGB", (terminal_width, terminal_height))
             image = resize_image(
                 image, terminal_width, terminal_height, char_aspect_ratio
             )
+            # Convert other modes (RGBA, palette, CMYK, ...) once so grayify and
+            # the colour pass below share the result
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
 
             # Convert image pixels to ASCII characters with the specified contrast factor
             # First apply grayscale using luma
@@ -269,7 +268,7 @@ def display_ascii_image(
             # Then apply contrast adjustment
             contrast_image = adjust_contrast(gray_image, contrast_factor)
             # Convert to ASCII using the contrast-adjusted image
-            ascii_str = pixel_to_ascii(contrast_image)
+            ascii_str = pixel_to_ascii(contrast_image, ascii_chars)
 
             # Split the ASCII string into rows
             img_width = image.width
@@ -280,36 +279,26 @@ def display_ascii_image(
                 ]
             )
 
+            # Read every pixel's colour in one call
+            if image.mode == "RGB":
+                rgb = image.tobytes()
+            else:
+                rgb = image.convert("RGB").tobytes()
+            row_stride = img_width * 3
+
             # Display using Rich with full color
+            rows = []
             for y, line in enumerate(ascii_img.splitlines()):
-                colored_line = Text()
-                for x, char in enumerate(line):
-                    # Make sure we're within image bounds
-                    if x < image.width and y < image.height:
-                        # Get the original color from the image
-                        pixel = image.getpixel((x, y))
-
-                        # Handle different image modes
-                        if image.mode == "RGB":
-                            r, g, b = pixel
-                        elif image.mode == "RGBA":
-                            r, g, b, a = pixel
-                        elif image.mode == "L":
-                            r = g = b = pixel
-                        else:
-                            # For other modes, convert to RGB
-                            rgb_image = image.convert("RGB")
-                            r, g, b = rgb_image.getpixel((x, y))
-
-                        # Create RGB color string
-                        color = f"rgb({r},{g},{b})"
-
-                        # Apply appropriate character for the brightness
-                        colored_line.append(char, style=color)
-                    else:
-                        # If outside image bounds, use a default character
-                        colored_line.append(" ")
-                console.print(colored_line)
+                row = rgb[y * row_stride : (y + 1) * row_stride]
+                # One single-character span per pixel, handed to Text in one go
+                # rather than appended character by character
+                spans = []
+                for x in range(len(line)):
+                    r, g, b = row[x * 3 : x * 3 + 3]
+                    spans.append(Span(x, x + 1, f"rgb({r},{g},{b})"))
+                rows.append(Text(line, spans=spans))
+            # Render and write the whole picture in one call
+            console.print(Text("\n").join(rows))
 
     except FileNotFoundError:
         console.print(f"[red]Error: The file '{image_path}' was not found.[/red]")
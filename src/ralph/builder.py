@@ -10,6 +10,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from ralph.prd import call_claude_code, validate_prd
+from ralph.utils import dump_prd
 
 
 # Approximate tokens per character (conservative estimate)
@@ -22,9 +23,36 @@ def _estimate_tokens(text: str) -> int:
     return len(text) // CHARS_PER_TOKEN
 
 
-def _get_json_schema() -> str:
-    """Return the target JSON schema for PRD output."""
-    return '''{
+def _split_into_chunks(prd_content: str) -> List[str]:
+    """Split PRD text into chunks of at most MAX_TOKENS_PER_BATCH tokens.
+
+    Chunks break on paragraph boundaries (blank lines). Each chunk is a
+    contiguous slice of the input, so nothing is re-joined. A single paragraph
+    larger than the limit becomes its own chunk.
+    """
+    chunks: List[str] = []
+    chunk_start = 0  # Offset of the current chunk in prd_content
+    pos = 0  # Offset of the current section
+    current_tokens = 0
+
+    for section in prd_content.split("\n\n"):
+        section_tokens = _estimate_tokens(section)
+
+        if current_tokens + section_tokens > MAX_TOKENS_PER_BATCH and pos > chunk_start:
+            # Close the chunk before this section, dropping the separator
+            chunks.append(prd_content[chunk_start:pos - 2])
+            chunk_start = pos
+            current_tokens = section_tokens
+        else:
+            current_tokens += section_tokens
+        pos += len(section) + 2
+
+    chunks.append(prd_content[chunk_start:])
+    return chunks
+
+
+# Target JSON schema for PRD output
+_JSON_SCHEMA = '''{
   "project": "Project name",
   "branchName": "ralph/feature-name-kebab-case",
   "description": "Brief project description",
@@ -58,18 +86,22 @@ def _get_json_schema() -> str:
 }'''
 
 
-def _build_conversion_prompt(prd_content: str, existing_stories: Optional[List[Dict]] = None) -> str:
+def _build_conversion_prompt(
+    prd_content: str,
+    existing_stories: Optional[List[Dict]] = None,
+    now: Optional[str] = None,
+) -> str:
     """Build prompt for Claude to convert PRD text to JSON.
 
     Args:
         prd_content: The raw PRD text in any format
         existing_stories: Previously parsed stories (for batched processing)
+        now: ISO timestamp to embed (defaults to the current time)
 
     Returns:
         The prompt string
     """
-    now = datetime.now().isoformat()
-    schema = _get_json_schema()
+    now = now or datetime.now().isoformat()
 
     batch_context = ""
     if existing_stories:
@@ -83,7 +115,7 @@ Only parse NEW stories from this content - do not repeat already-parsed stories.
     return f"""Convert this PRD document into structured JSON format.
 
 TARGET SCHEMA:
-{schema}
+{_JSON_SCHEMA}
 
 RULES:
 1. Extract ALL user stories from the document
@@ -136,41 +168,34 @@ def _parse_json_response(response: str) -> Dict[str, Any]:
     except json.JSONDecodeError:
         pass
 
-    # Try to find JSON object boundaries
+    # Otherwise decode the first JSON object in the text; raw_decode tracks
+    # nesting (including braces inside strings) and ignores trailing text
     start = response.find("{")
     if start == -1:
         raise ValueError("No JSON object found in response")
 
-    # Find matching closing brace
-    depth = 0
-    end = start
-    for i, char in enumerate(response[start:], start):
-        if char == "{":
-            depth += 1
-        elif char == "}":
-            depth -= 1
-            if depth == 0:
-                end = i + 1
-                break
-
     try:
-        parsed: Dict[str, Any] = json.loads(response[start:end])
+        parsed: Dict[str, Any]
+        parsed, _ = json.JSONDecoder().raw_decode(response, start)
         return parsed
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse JSON: {e}")
 
 
-def _ensure_valid_structure(prd_json: Dict[str, Any], prd_path: Path) -> Dict[str, Any]:
+def _ensure_valid_structure(
+    prd_json: Dict[str, Any], prd_path: Path, now: Optional[str] = None
+) -> Dict[str, Any]:
     """Ensure PRD JSON has all required fields with valid values.
 
     Args:
         prd_json: The parsed PRD JSON
         prd_path: Path to original PRD (for fallback values)
+        now: ISO timestamp for metadata (defaults to the current time)
 
     Returns:
         The validated and enhanced PRD JSON
     """
-    now = datetime.now().isoformat()
+    now = now or datetime.now().isoformat()
 
     # Ensure top-level fields
     if not prd_json.get("project"):
@@ -281,14 +306,15 @@ class PRDBuilder:
             FileNotFoundError: If the PRD file doesn't exist
             ValueError: If the PRD can't be parsed
         """
-        if not prd_path.exists():
-            raise FileNotFoundError(f"PRD file not found: {prd_path}")
+        # Read PRD content
+        try:
+            prd_content = prd_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"PRD file not found: {prd_path}") from None
 
         model = model or self.model
-
-        # Read PRD content
-        with open(prd_path, 'r') as f:
-            prd_content = f.read()
+        # One timestamp for the prompt(s) and the metadata of this build
+        now = datetime.now().isoformat()
 
         print(f"📄 Building PRD from: {prd_path}")
         print(f"🤖 Using Claude ({model}) to parse...")
@@ -298,12 +324,12 @@ class PRDBuilder:
 
         if estimated_tokens > MAX_TOKENS_PER_BATCH:
             print(f"   Large PRD detected (~{estimated_tokens} tokens), using batched processing...")
-            prd_json = self._build_batched(prd_content, model)
+            prd_json = self._build_batched(prd_content, model, now)
         else:
-            prd_json = self._build_single(prd_content, model)
+            prd_json = self._build_single(prd_content, model, now)
 
         # Ensure valid structure
-        prd_json = _ensure_valid_structure(prd_json, prd_path)
+        prd_json = _ensure_valid_structure(prd_json, prd_path, now)
 
         # Run validation and show results
         result = validate_prd(prd_json)
@@ -313,8 +339,7 @@ class PRDBuilder:
 
         # Save to file
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w') as f:
-            json.dump(prd_json, f, indent=2)
+        dump_prd(prd_json, output_path)
 
         stories = prd_json.get("userStories", [])
         phases = prd_json.get("phases", {})
@@ -323,21 +348,26 @@ class PRDBuilder:
 
         return output_path
 
-    def _build_single(self, prd_content: str, model: str) -> Dict[str, Any]:
+    def _build_single(
+        self, prd_content: str, model: str, now: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Build PRD JSON in a single Claude call.
 
         Args:
             prd_content: The full PRD text
             model: Claude model to use
+            now: ISO timestamp for the prompt
 
         Returns:
             Parsed PRD JSON
         """
-        prompt = _build_conversion_prompt(prd_content)
+        prompt = _build_conversion_prompt(prd_content, now=now)
         response = call_claude_code(prompt, model=model, timeout=300)
         return _parse_json_response(response)
 
-    def _build_batched(self, prd_content: str, model: str) -> Dict[str, Any]:
+    def _build_batched(
+        self, prd_content: str, model: str, now: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Build PRD JSON in batches for large documents.
 
         Splits the document by estimated token count and processes
@@ -346,31 +376,12 @@ class PRDBuilder:
         Args:
             prd_content: The full PRD text
             model: Claude model to use
+            now: ISO timestamp shared by every chunk's prompt
 
         Returns:
             Merged PRD JSON with all stories
         """
-        # Split into chunks by paragraph/section
-        # Try to split on double newlines (paragraph boundaries)
-        sections = prd_content.split("\n\n")
-
-        chunks: List[str] = []
-        current_chunk: List[str] = []
-        current_tokens = 0
-
-        for section in sections:
-            section_tokens = _estimate_tokens(section)
-
-            if current_tokens + section_tokens > MAX_TOKENS_PER_BATCH and current_chunk:
-                chunks.append("\n\n".join(current_chunk))
-                current_chunk = [section]
-                current_tokens = section_tokens
-            else:
-                current_chunk.append(section)
-                current_tokens += section_tokens
-
-        if current_chunk:
-            chunks.append("\n\n".join(current_chunk))
+        chunks = _split_into_chunks(prd_content)
 
         print(f"   Split into {len(chunks)} chunks")
 
@@ -381,7 +392,7 @@ class PRDBuilder:
         for i, chunk in enumerate(chunks):
             print(f"   Processing chunk {i+1}/{len(chunks)}...")
 
-            prompt = _build_conversion_prompt(chunk, all_stories if all_stories else None)
+            prompt = _build_conversion_prompt(chunk, all_stories if all_stories else None, now)
             response = call_claude_code(prompt, model=model, timeout=300)
             chunk_json = _parse_json_response(response)
 
@@ -394,14 +405,16 @@ class PRDBuilder:
                 new_stories = chunk_json.get("userStories", [])
 
                 # Renumber to avoid ID conflicts
+                existing_ids = {s.get("id") for s in all_stories}
                 for story in new_stories:
-                    existing_ids = {s.get("id") for s in all_stories}
                     if story.get("id") in existing_ids:
                         # Generate new ID
                         story["id"] = f"US-{len(all_stories) + 1:03d}"
                     story["priority"] = len(all_stories) + 1
-
-                all_stories.extend(new_stories)
+                    if "id" in story:
+                        # ID-less stories get one from _ensure_valid_structure
+                        existing_ids.add(story["id"])
+                    all_stories.append(story)
 
                 # Merge phases
                 if "phases" in chunk_json and "phases" in base_json:
@@ -7,13 +7,21 @@ tree structure of what Claude is doing and why.
 """
 
 import json
+import os
 import sys
 import subprocess
 import argparse
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List, Union
 from dataclasses import dataclass, field
 
+# Decode stream lines with orjson when available (optional dependency); its
+# JSONDecodeError subclasses json.JSONDecodeError, so error handling is shared
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads  # type: ignore[assignment]
+
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -34,7 +42,43 @@ class Colors:
     GRAY = '\033[90m'
 
 
-@dataclass
+# Coloured "name:" prefixes for the built-in tools, built once
+_TOOL_PREFIXES = {
+    "bash": f"{Colors.YELLOW}bash:{Colors.RESET} ",
+    "write": f"{Colors.GREEN}write:{Colors.RESET} ",
+    "edit": f"{Colors.GREEN}edit:{Colors.RESET} ",
+    "read": f"{Colors.BLUE}read:{Colors.RESET} ",
+    "glob": f"{Colors.MAGENTA}glob:{Colors.RESET} ",
+    "grep": f"{Colors.MAGENTA}grep:{Colors.RESET} ",
+    "task": f"{Colors.CYAN}task:{Colors.RESET} ",
+}
+
+# Tool status markers
+_OK_MARK = f" {Colors.GREEN}✓{Colors.RESET}"
+_RESULT_MARK = f" {Colors.GREEN}→{Colors.RESET} {Colors.GRAY}"
+
+# Session banner
+_HEADER_TOP = f"{Colors.CYAN}╔{'═' * 70}╗{Colors.RESET}"
+_HEADER_TITLE = (
+    f"{Colors.CYAN}║{Colors.RESET}  {Colors.BOLD}RALPH → CLAUDE{Colors.RESET}"
+    f"{' ' * 54}{Colors.CYAN}║{Colors.RESET}"
+)
+_HEADER_INFO_TMPL = (
+    f"{Colors.CYAN}║{Colors.RESET}{Colors.GRAY}{{info:<70}}{Colors.RESET}{Colors.CYAN}║{Colors.RESET}"
+)
+_HEADER_BOTTOM = f"{Colors.CYAN}╚{'═' * 70}╝{Colors.RESET}"
+
+# Session footer
+_FOOTER_RULE = f"{Colors.GRAY}{'─' * 71}{Colors.RESET}"
+_FOOTER_SUCCESS = f"{Colors.GREEN}✓ Complete{Colors.RESET} │ "
+_FOOTER_FAILURE = f"{Colors.RED}✗ Complete{Colors.RESET} │ "
+
+# Slotted dataclasses (3.10+) drop the per-instance __dict__; on 3.9 the
+# classes fall back to regular dataclasses
+_DATACLASS_SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class ToolCall:
     """Represents a single tool call."""
     name: str
@@ -47,7 +91,7 @@ class ToolCall:
     completed: bool = False
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class IntentGroup:
     """A group of tool calls under a single intent."""
     intent: str
@@ -60,7 +104,6 @@ class StreamProcessor:
     """Processes Claude stream output and groups by intent."""
 
     def __init__(self) -> None:
-        self.groups: List[IntentGroup] = []
         self.current_group: Optional[IntentGroup] = None
         self.pending_tools: Dict[str, ToolCall] = {}  # tool_use_id -> ToolCall
         self.session_start: Optional[datetime] = None
@@ -69,20 +112,29 @@ class StreamProcessor:
         self.total_tools: int = 0
         self.total_errors: int = 0
 
+        # Message and content-part dispatch tables
+        self._message_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            "system": self._handle_system,
+            "assistant": self._handle_assistant,
+            "user": self._handle_user,
+            "result": self._handle_result,
+        }
+        self._assistant_part_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            "text": self._handle_text_part,
+            "tool_use": self._handle_tool_use_part,
+        }
+
     def _format_timestamp(self) -> str:
         return datetime.now().strftime("%H:%M:%S")
 
     def _print_header(self) -> None:
         """Print session header."""
-        print(f"{Colors.CYAN}╔══════════════════════════════════════════════════════════════════════╗{Colors.RESET}")
-        print(f"{Colors.CYAN}║{Colors.RESET}  {Colors.BOLD}RALPH → CLAUDE{Colors.RESET}                                                      {Colors.CYAN}║{Colors.RESET}")
         model_display = self.model[:20] if self.model else "unknown"
         session_display = self.session_id[:8] if self.session_id else "unknown"
-        info_line = f"  Model: {model_display}  │  Session: {session_display}"
-        padding = 70 - len(info_line)
-        print(f"{Colors.CYAN}║{Colors.RESET}{Colors.GRAY}{info_line}{' ' * padding}{Colors.RESET}{Colors.CYAN}║{Colors.RESET}")
-        print(f"{Colors.CYAN}╚══════════════════════════════════════════════════════════════════════╝{Colors.RESET}")
-        print()
+        info = _HEADER_INFO_TMPL.format(
+            info=f"  Model: {model_display}  │  Session: {session_display}"
+        )
+        sys.stdout.write(f"{_HEADER_TOP}\n{_HEADER_TITLE}\n{info}\n{_HEADER_BOTTOM}\n\n")
 
     def _flush_current_group(self) -> None:
         """Close the current group (tools already printed incrementally)."""
@@ -91,42 +143,37 @@ class StreamProcessor:
 
         # Just add a blank line to separate groups
         # (tools were already printed incrementally via _reprint_current_group)
-        print()
-        self.groups.append(self.current_group)
+        sys.stdout.write("\n")
+        # Closed groups aren't kept: nothing reads them once printed
         self.current_group = None
 
+    @staticmethod
+    def _truncate(s: str, n: int = 40, c: int = 37) -> str:
+        """Return s, or its first c characters plus "..." if longer than n."""
+        return s if len(s) <= n else s[:c] + "..."
+
     def _format_tool_info(self, tool: ToolCall) -> str:
         """Format tool name and key details."""
         name_lower = tool.name.lower()
+        prefix = _TOOL_PREFIXES.get(name_lower)
+
+        if prefix is None:
+            return f"{Colors.WHITE}{tool.name}:{Colors.RESET} {tool.description or ''}"
 
         if name_lower == "bash":
             cmd = tool.command or tool.description or "command"
-            # Truncate long commands
-            if len(cmd) > 40:
-                cmd = cmd[:37] + "..."
-            return f"{Colors.YELLOW}bash:{Colors.RESET} {cmd}"
+            return prefix + self._truncate(cmd)
 
-        elif name_lower in ("write", "edit"):
+        if name_lower in ("write", "edit", "read"):
             path = tool.file_path or "file"
             # Show just filename for brevity
-            if "/" in path:
-                path = path.split("/")[-1]
-            return f"{Colors.GREEN}{tool.name.lower()}:{Colors.RESET} {path}"
-
-        elif name_lower == "read":
-            path = tool.file_path or "file"
-            if "/" in path:
-                path = path.split("/")[-1]
-            return f"{Colors.BLUE}read:{Colors.RESET} {path}"
-
-        elif name_lower in ("glob", "grep"):
-            return f"{Colors.MAGENTA}{tool.name.lower()}:{Colors.RESET} {tool.description or 'search'}"
+            return prefix + path.rpartition("/")[2]
 
-        elif name_lower == "task":
-            return f"{Colors.CYAN}task:{Colors.RESET} {tool.description or 'subtask'}"
+        if name_lower == "task":
+            return prefix + (tool.description or "subtask")
 
-        else:
-            return f"{Colors.WHITE}{tool.name}:{Colors.RESET} {tool.description or ''}"
+        # glob / grep
+        return prefix + (tool.description or "search")
 
     def _format_tool_status(self, tool: ToolCall) -> str:
         """Format tool completion status."""
@@ -136,7 +183,7 @@ class StreamProcessor:
 
         if tool.is_error:
             # Only show first line of error (typically "Exit code N")
-            first_line = (tool.result or "error").split('\n')[0].strip()
+            first_line = (tool.result or "error").partition('\n')[0].strip()
             return f" {Colors.RED}✗ {first_line}{Colors.RESET}"
 
         # Show brief result for certain tools
@@ -146,11 +193,11 @@ class StreamProcessor:
             if tool.name.lower() == "bash" and result:
                 lines = result.split('\n')
                 if len(lines) == 1 and len(result) < 40:
-                    return f" {Colors.GREEN}→{Colors.RESET} {Colors.GRAY}{result}{Colors.RESET}"
+                    return f"{_RESULT_MARK}{result}{Colors.RESET}"
                 elif len(lines) > 1:
-                    return f" {Colors.GREEN}→{Colors.RESET} {Colors.GRAY}({len(lines)} lines){Colors.RESET}"
+                    return f"{_RESULT_MARK}({len(lines)} lines){Colors.RESET}"
 
-        return f" {Colors.GREEN}✓{Colors.RESET}"
+        return _OK_MARK
 
     def _start_new_group(self, intent: str) -> None:
         """Start a new intent group."""
@@ -186,8 +233,11 @@ class StreamProcessor:
                 # Print error status since original line showed in-progress
                 tool_info = self._format_tool_info(tool)
                 # Only show first line of error (typically "Exit code N")
-                first_line = (result or "error").split('\n')[0].strip()
-                print(f"           {Colors.GRAY}└──{Colors.RESET} {tool_info} {Colors.RED}✗ {first_line}{Colors.RESET}")
+                first_line = (result or "error").partition('\n')[0].strip()
+                sys.stdout.write(
+                    f"           {Colors.GRAY}└──{Colors.RESET} {tool_info} "
+                    f"{Colors.RED}✗ {first_line}{Colors.RESET}\n"
+                )
             del self.pending_tools[tool_id]
 
     def _reprint_current_group(self) -> None:
@@ -210,92 +260,120 @@ class StreamProcessor:
 
             tool_info = self._format_tool_info(tool)
             status = self._format_tool_status(tool)
+            line = f"           {Colors.GRAY}{prefix}{Colors.RESET} {tool_info}{status}\n"
 
             if len(tools) == 1:
                 # First tool - print the group header too
                 timestamp = f"[{group.timestamp}]"
-                intent_display = group.intent[:60] + "..." if len(group.intent) > 60 else group.intent
+                intent_display = self._truncate(group.intent, 60, 60)
 
-                tool_names = [t.name.lower() for t in tools]
-                if any("glob" in n or "grep" in n or "read" in n for n in tool_names):
+                # The header is printed with the group's first tool, so that
+                # tool alone decides the icon
+                name = tool.name.lower()
+                if "glob" in name or "grep" in name or "read" in name:
                     icon = "🔍"
-                elif any("write" in n or "edit" in n for n in tool_names):
+                elif "write" in name or "edit" in name:
                     icon = "📁"
-                elif any("bash" in n for n in tool_names):
+                elif "bash" in name:
                     icon = "⚡"
                 else:
                     icon = "▸"
 
-                print(f"\n{Colors.GRAY}{timestamp}{Colors.RESET} {icon} {Colors.BOLD}{intent_display}{Colors.RESET}")
+                # Header and first tool go out in one write
+                line = (
+                    f"\n{Colors.GRAY}{timestamp}{Colors.RESET} {icon} "
+                    f"{Colors.BOLD}{intent_display}{Colors.RESET}\n"
+                    + line
+                )
 
-            print(f"           {Colors.GRAY}{prefix}{Colors.RESET} {tool_info}{status}")
+            sys.stdout.write(line)
 
-    def process_line(self, line: str) -> None:
-        """Process a single line from the stream."""
+    def process_line(self, line: Union[bytes, bytearray]) -> None:
+        """Process a single line (raw bytes) from the stream."""
         line = line.strip()
-        if not line:
+        # Every stream event is a JSON object; reject blank lines and
+        # non-JSON output without going through the parser's error path
+        if line[:1] != b"{":
             return
 
         try:
-            data = json.loads(line)
-            msg_type = data.get("type")
-
-            if msg_type == "system":
-                subtype = data.get("subtype", "")
-                if subtype == "init":
-                    self.model = data.get("model", "unknown")
-                    self.session_id = data.get("session_id", "")
-                    self.session_start = datetime.now()
-                    self._print_header()
-
-            elif msg_type == "assistant":
-                message = data.get("message", {})
-                content = message.get("content", [])
-
-                # Process content parts
-                for part in content:
-                    if isinstance(part, dict):
-                        if part.get("type") == "text":
-                            text = part.get("text", "").strip()
-                            if text:
-                                self._start_new_group(text)
-
-                        elif part.get("type") == "tool_use":
-                            tool_id = part.get("id", "")
-                            tool_name = part.get("name", "unknown")
-                            tool_input = part.get("input", {})
-
-                            tool = ToolCall(
-                                name=tool_name,
-                                description=tool_input.get("description", ""),
-                                file_path=tool_input.get("file_path", ""),
-                                command=tool_input.get("command", "")
-                            )
-                            self._add_tool_to_group(tool_id, tool)
-
-            elif msg_type == "user":
-                message = data.get("message", {})
-                content = message.get("content", [])
-
-                for part in content:
-                    if isinstance(part, dict) and part.get("type") == "tool_result":
-                        tool_id = part.get("tool_use_id", "")
-                        is_error = part.get("is_error", False)
-                        result_content = part.get("content", "")
-
-                        # Extract text from content
-                        if isinstance(result_content, list):
-                            texts = [p.get("text", "") for p in result_content if isinstance(p, dict)]
-                            result_content = "\n".join(texts)
-
-                        self._complete_tool(tool_id, str(result_content), is_error)
-
-            elif msg_type == "result":
-                self._flush_current_group()
-                self._print_footer(data)
-
+            data = json_loads(line)
         except json.JSONDecodeError:
-            pass
+            return
+
+        handler = self._message_handlers.get(data.get("type", ""))
+        if handler:
+            handler(data)
+
+    def _handle_system(self, data: Dict[str, Any]) -> None:
+        """Handle a system message (session init)."""
+        if data.get("subtype", "") == "init":
+            self.model = data.get("model", "unknown")
+            self.session_id = data.get("session_id", "")
+            self.session_start = datetime.now()
+            self._print_header()
+
+    def _handle_assistant(self, data: Dict[str, Any]) -> None:
+        """Handle an assistant message (intent text and tool calls)."""
+        message = data.get("message", {})
+        content = message.get("content", [])
+
+        # Process content parts; parsed JSON objects are always exact dicts,
+        # so an identity check on the type is enough
+        handlers = self._assistant_part_handlers
+        for part in content:
+            if type(part) is dict:
+                handler = handlers.get(part.get("type", ""))
+                if handler:
+                    handler(part)
+
+    def _handle_text_part(self, part: Dict[str, Any]) -> None:
+        """Start a new intent group from assistant text."""
+        text = part.get("text", "").strip()
+        if text:
+            self._start_new_group(text)
+
+    def _handle_tool_use_part(self, part: Dict[str, Any]) -> None:
+        """Record a tool call."""
+        tool_id = part.get("id", "")
+        tool_name = part.get("name", "unknown")
+        tool_input = part.get("input", {})
+
+        tool = ToolCall(
+            name=tool_name,
+            description=tool_input.get("description", ""),
+            file_path=tool_input.get("file_path", ""),
+            command=tool_input.get("command", "")
+        )
+        self._add_tool_to_group(tool_id, tool)
+
+    def _handle_user(self, data: Dict[str, Any]) -> None:
+        """Handle a user message (tool results)."""
+        message = data.get("message", {})
+        content = message.get("content", [])
+
+        for part in content:
+            if type(part) is dict and part.get("type") == "tool_result":
+                tool_id = part.get("tool_use_id", "")
+                is_error = part.get("is_error", False)
+                result_content = part.get("content", "")
+
+                # Extract text from content; a single text block (the usual
+                # case) is passed through without building a joined copy
+                if isinstance(result_content, list):
+                    if len(result_content) == 1 and type(result_content[0]) is dict:
+                        result_content = result_content[0].get("text", "")
+                    else:
+                        result_content = "\n".join(
+                            [p.get("text", "") for p in result_content if type(p) is dict]
+                        )
+
+                self._complete_tool(tool_id, str(result_content), is_error)
+
+    def _handle_result(self, data: Dict[str, Any]) -> None:
+        """Handle the final result message."""
+        self._flush_current_group()
+        self._print_footer(data)
 
     def _print_footer(self, data: Dict[str, Any]) -> None:
         """Print session footer."""
@@ -307,14 +385,7 @@ class StreamProcessor:
         total_tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
         cost = data.get("total_cost_usd", 0)
 
-        print()
-        print(f"{Colors.GRAY}───────────────────────────────────────────────────────────────────────{Colors.RESET}")
-
-        status_icon = "✓" if subtype == "success" else "✗"
-        status_color = Colors.GREEN if subtype == "success" else Colors.RED
-
-        stats = []
-        stats.append(f"{self.total_tools} tools")
+        stats = [f"{self.total_tools} tools"]
         if self.total_errors > 0:
             stats.append(f"{Colors.RED}{self.total_errors} errors{Colors.RESET}")
         stats.append(f"{duration_s:.1f}s")
@@ -323,7 +394,8 @@ class StreamProcessor:
         if cost:
             stats.append(f"${cost:.4f}")
 
-        print(f"{status_color}{status_icon} Complete{Colors.RESET} │ {' │ '.join(stats)}")
+        status = _FOOTER_SUCCESS if subtype == "success" else _FOOTER_FAILURE
+        sys.stdout.write(f"\n{_FOOTER_RULE}\n{status}{' │ '.join(stats)}\n")
 
 
 def main() -> None:
@@ -370,13 +442,30 @@ def main() -> None:
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
         )
 
         if process.stdout:
-            for line in process.stdout:
-                processor.process_line(line)
+            # Read raw bytes and split lines ourselves; the JSON parser takes
+            # bytes directly, so there's no text decoding layer in between
+            fd = process.stdout.fileno()
+            partial = bytearray()
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                end = chunk.rfind(b"\n")
+                if end == -1:
+                    partial += chunk
+                    continue
+                partial += chunk[:end]
+                for line in partial.split(b"\n"):
+                    processor.process_line(line)
+                partial = bytearray(chunk[end + 1:])
+                # One flush per read: everything Claude has sent so far is
+                # shown, without a flush for every line in a burst
+                sys.stdout.flush()
+            if partial:
+                processor.process_line(partial)
                 sys.stdout.flush()
 
         process.wait()
@@ -1,243 +1,148 @@
 """Command-line interface for Ralph."""
 
 import argparse
+import importlib
 import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import NoReturn
+from typing import Callable, Dict, List, NoReturn, Optional, Sequence, Tuple
 
 from ralph import __version__
-from ralph import commands
-from ralph.ascii_art import display_ralph_mascot
 
 
-def main() -> NoReturn:
-    """Main CLI entry point."""
-    parser = argparse.ArgumentParser(
-        prog="ralph",
-        description="Ralph: Autonomous AI Agent Loop for executing PRDs",
-        epilog="""
-Examples:
-  ralph init                        # Initialize Ralph in current directory
-  ralph process-prd prd.txt         # Process PRD and save to .ralph/prd.json
-  ralph build-prd large-prd.txt     # Build large PRD incrementally (10+ stories)
-  ralph execute                     # Execute PRD in .ralph/
-  ralph execute --phase 1           # Execute only phase 1 stories
-  ralph status                      # Show status
-  ralph validate                    # Validate PRD structure
-  ralph summary                     # Show PRD summary
-  ralph skip-story US-023           # Skip a story
-  ralph close-phase 2               # Close a phase
-        """,
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
-
-    parser.add_argument(
-        "--version",
-        action="version",
-        version=f"%(prog)s {__version__}",
-    )
-
+def _add_process_prd_args(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
-        "-C", "--dir",
-        type=Path,
-        default=None,
-        help="Run as if ralph was started in this directory",
-    )
-
-    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
-
-    # Init command
-    subparsers.add_parser(
-        "init",
-        help="Initialize Ralph configuration in current directory",
-    )
-
-    # Process PRD command
-    prd_parser = subparsers.add_parser(
-        "process-prd",
-        help="Convert PRD document to .ralph/prd.json",
-    )
-    prd_parser.add_argument(
         "prd_file",
         type=Path,
         help="Path to PRD text file",
     )
-    prd_parser.add_argument(
+    parser.add_argument(
         "--model",
         type=str,
         default="claude-opus-4-5",
         help="Claude model to use for parsing (default: claude-opus-4-5)",
     )
 
-    # Build PRD command (for large PRDs)
-    build_prd_parser = subparsers.add_parser(
-        "build-prd",
-        help="Build PRD JSON incrementally (for large PRDs with 10+ stories)",
-    )
-    build_prd_parser.add_argument(
+
+def _add_build_prd_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "prd_file",
         type=Path,
         help="Path to PRD text file",
     )
-    build_prd_parser.add_argument(
+    parser.add_argument(
         "--output",
         "-o",
         type=Path,
         help="Output JSON file path (default: .ralph/prd.json)",
     )
-    build_prd_parser.add_argument(
+    parser.add_argument(
         "--model",
         type=str,
         default="claude-opus-4-5",
         help="Claude model to use for parsing (default: claude-opus-4-5)",
     )
 
-    # Execute command
-    exec_parser = subparsers.add_parser(
-        "execute",
-        help="Execute Ralph loop",
-        aliases=["execute-plan", "run"],
-    )
-    exec_parser.add_argument(
+
+def _add_execute_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--max-iterations",
         type=int,
         help="Maximum iterations (0 = unlimited)",
     )
-    exec_parser.add_argument(
+    parser.add_argument(
         "--phase",
         type=int,
         help="Execute specific phase only",
     )
-    exec_parser.add_argument(
+    parser.add_argument(
         "--model",
         type=str,
         help="Claude model to use (overrides auto-detected value)",
     )
-    exec_parser.add_argument(
+    parser.add_argument(
         "--verbose",
         action="store_true",
         help="Show verbose output",
     )
 
-    # Status command
-    status_parser = subparsers.add_parser(
-        "status",
-        help="Show Ralph status",
-    )
-    status_parser.add_argument(
+
+def _add_status_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--phase",
         type=int,
         help="Show status for specific phase only",
     )
 
-    # Select command
-    subparsers.add_parser(
-        "select",
-        help="Interactive story selection menu",
-    )
 
-    # Validate command
-    validate_parser = subparsers.add_parser(
-        "validate",
-        help="Validate PRD JSON structure",
-    )
-    validate_parser.add_argument(
+def _add_validate_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--strict",
         action="store_true",
         help="Treat warnings as errors",
     )
 
-    # Summary command
-    subparsers.add_parser(
-        "summary",
-        help="Show PRD summary with completion statistics",
-    )
 
-    # Close phase command
-    close_phase_parser = subparsers.add_parser(
-        "close-phase",
-        help="Mark all incomplete stories in a phase as skipped",
-    )
-    close_phase_parser.add_argument(
+def _add_close_phase_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "phase_number",
         type=int,
         help="Phase number to close",
     )
 
-    # Skip story command
-    skip_story_parser = subparsers.add_parser(
-        "skip-story",
-        help="Mark a story as skipped",
-    )
-    skip_story_parser.add_argument(
+
+def _add_skip_story_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "story_id",
         type=str,
         help="Story ID to skip (e.g., US-023)",
     )
 
-    # Start story command
-    start_story_parser = subparsers.add_parser(
-        "start-story",
-        help="Mark a story as in_progress",
-    )
-    start_story_parser.add_argument(
+
+def _add_start_story_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "story_id",
         type=str,
         help="Story ID to start (e.g., US-023)",
     )
 
-    # In-progress command
-    subparsers.add_parser(
-        "in-progress",
-        help="Show all stories currently marked as in_progress",
-    )
 
-    # Clear stale command
-    clear_stale_parser = subparsers.add_parser(
-        "clear-stale",
-        help="Clear stale in_progress status from stories",
-    )
-    clear_stale_parser.add_argument(
+def _add_clear_stale_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--max-age-hours",
         type=int,
         default=24,
         help="Maximum hours a story can be in_progress (default: 24)",
     )
 
-    # List stories command
-    list_stories_parser = subparsers.add_parser(
-        "list-stories",
-        help="List stories with optional filters",
-    )
-    list_stories_parser.add_argument(
+
+def _add_list_stories_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--phase",
         type=int,
         help="Filter by phase number",
     )
-    list_stories_parser.add_argument(
+    parser.add_argument(
         "--status",
         type=str,
         choices=["incomplete", "in_progress", "complete", "skipped"],
         help="Filter by status",
     )
 
-    # View command
-    view_parser = subparsers.add_parser(
-        "view",
-        help="View PRD progress with pretty formatting",
-    )
-    view_parser.add_argument(
+
+def _add_view_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "--once",
         action="store_true",
         help="Display once and exit (no watching)",
     )
-    view_parser.add_argument(
+    parser.add_argument(
         "--expand",
         "-e",
         action="store_true",
         help="Expand closed phases (show all stories)",
     )
-    view_parser.add_argument(
+    parser.add_argument(
         "-i",
         "--interval",
         type=float,
@@ -245,37 +150,149 @@ Examples:
         help="Refresh interval in seconds (default: 1.0)",
     )
 
+
+# (name, help, aliases, argument registrar) for every subcommand, in help order
+_SUBCOMMANDS: List[
+    Tuple[str, str, Sequence[str], Optional[Callable[[argparse.ArgumentParser], None]]]
+] = [
+    ("init", "Initialize Ralph configuration in current directory", (), None),
+    ("process-prd", "Convert PRD document to .ralph/prd.json", (), _add_process_prd_args),
+    (
+        "build-prd",
+        "Build PRD JSON incrementally (for large PRDs with 10+ stories)",
+        (),
+        _add_build_prd_args,
+    ),
+    ("execute", "Execute Ralph loop", ("execute-plan", "run"), _add_execute_args),
+    ("status", "Show Ralph status", (), _add_status_args),
+    ("select", "Interactive story selection menu", (), None),
+    ("validate", "Validate PRD JSON structure", (), _add_validate_args),
+    ("summary", "Show PRD summary with completion statistics", (), None),
+    (
+        "close-phase",
+        "Mark all incomplete stories in a phase as skipped",
+        (),
+        _add_close_phase_args,
+    ),
+    ("skip-story", "Mark a story as skipped", (), _add_skip_story_args),
+    ("start-story", "Mark a story as in_progress", (), _add_start_story_args),
+    ("in-progress", "Show all stories currently marked as in_progress", (), None),
+    ("clear-stale", "Clear stale in_progress status from stories", (), _add_clear_stale_args),
+    ("list-stories", "List stories with optional filters", (), _add_list_stories_args),
+    ("view", "View PRD progress with pretty formatting", (), _add_view_args),
+]
+
+
+# Subcommand or alias -> subcommand name
+_COMMAND_NAMES = {
+    alias: name
+    for name, _help, aliases, _add_args in _SUBCOMMANDS
+    for alias in (name, *aliases)
+}
+
+# Module holding the handler for every subcommand, "<name>_command" with dashes
+# as underscores, except those listed in _HANDLER_OVERRIDES
+_HANDLER_MODULE = "ralph.commands"
+_HANDLER_OVERRIDES: Dict[str, Tuple[str, str]] = {}
+
+
+def _command_handler(command: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Return the (module, function) handling a subcommand or alias, or None."""
+    name = _COMMAND_NAMES.get(command or "")
+    if name is None:
+        return None
+    override = _HANDLER_OVERRIDES.get(name)
+    if override:
+        return override
+    return _HANDLER_MODULE, f"{name.replace('-', '_')}_command"
+
+
+def _find_command(argv: Sequence[str]) -> str:
+    """Return the first positional token in argv (the subcommand), or ""."""
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg in ("-C", "--dir"):
+            skip_value = True
+        elif not arg.startswith("-"):
+            return arg
+    return ""
+
+
+@lru_cache(maxsize=None)
+def _build_parser(command: Optional[str] = None) -> argparse.ArgumentParser:
+    """Build the argument parser (once per process and command).
+
+    Every subcommand is registered so help and error messages list them all,
+    but only the subcommand named by ``command`` gets its arguments. ``None``
+    registers arguments for every subcommand.
+    """
+    parser = argparse.ArgumentParser(
+        prog="ralph",
+        description="Ralph: Autonomous AI Agent Loop for executing PRDs",
+        epilog="""
+Examples:
+  ralph init                        # Initialize Ralph in current directory
+  ralph process-prd prd.txt         # Process PRD and save to .ralph/prd.json
+  ralph build-prd large-prd.txt     # Build large PRD incrementally (10+ stories)
+  ralph execute                     # Execute PRD in .ralph/
+  ralph execute --phase 1           # Execute only phase 1 stories
+  ralph status                      # Show status
+  ralph validate                    # Validate PRD structure
+  ralph summary                     # Show PRD summary
+  ralph skip-story US-023           # Skip a story
+  ralph close-phase 2               # Close a phase
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        # _find_command only knows -C/--dir take a value; an abbreviation like
+        # "--di foo" would make it pick "foo" as the command
+        allow_abbrev=False,
+    )
+
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"%(prog)s {__version__}",
+    )
+
+    parser.add_argument(
+        "-C", "--dir",
+        type=Path,
+        default=None,
+        help="Run as if ralph was started in this directory",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
+
+    for name, help_text, aliases, add_args in _SUBCOMMANDS:
+        subparser = subparsers.add_parser(name, help=help_text, aliases=list(aliases))
+        if add_args and (command is None or command == name or command in aliases):
+            add_args(subparser)
+
+    return parser
+
+
+def main() -> NoReturn:
+    """Main CLI entry point."""
+    parser = _build_parser(_find_command(sys.argv[1:]))
     args = parser.parse_args()
 
     if not args.command:
+        # Imported here: Pillow and rich cost ~40 ms that other commands don't need
+        from ralph.ascii_art import display_ralph_mascot
+
         display_ralph_mascot()
         print()  # Add spacing after mascot
         parser.print_help()
         sys.exit(0)
 
-    # Route to command handlers
-    command_map = {
-        "init": commands.init_command,
-        "process-prd": commands.process_prd_command,
-        "build-prd": commands.build_prd_command,
-        "execute": commands.execute_command,
-        "execute-plan": commands.execute_command,
-        "run": commands.execute_command,
-        "status": commands.status_command,
-        "select": commands.select_command,
-        "validate": commands.validate_command,
-        "summary": commands.summary_command,
-        "close-phase": commands.close_phase_command,
-        "skip-story": commands.skip_story_command,
-        "start-story": commands.start_story_command,
-        "in-progress": commands.in_progress_command,
-        "clear-stale": commands.clear_stale_command,
-        "list-stories": commands.list_stories_command,
-        "view": commands.view_command,
-    }
-
-    handler = command_map.get(args.command)
-    if handler:
+    # Route to command handlers; resolved on dispatch so --help and --version
+    # don't pay for importing every handler's dependencies
+    target = _command_handler(args.command)
+    if target:
+        mod_name, fn_name = target
+        handler = getattr(importlib.import_module(mod_name), fn_name)
         handler(args)
     else:
         print(f"❌ Unknown command: {args.command}")
@@ -6,6 +6,7 @@ import sys
 from pathlib import Path
 
 from ralph.prd import PRDParser, validate_prd
+from ralph.utils import read_prd
 
 
 def get_project_dir(args: argparse.Namespace) -> Path:
@@ -132,7 +133,7 @@ def status_command(args: argparse.Namespace) -> None:
     loop = RalphLoop(config=config)
 
     try:
-        loop.show_info(prd_path=prd_path, phase=args.phase if hasattr(args, 'phase') else None)
+        loop.show_info(prd_path=prd_path, phase=args.phase)
     except Exception as e:
         print(f"❌ Failed to show status: {e}")
         sys.exit(1)
@@ -149,8 +150,7 @@ def select_command(args: argparse.Namespace) -> None:
         sys.exit(1)
 
     # Load PRD
-    with open(prd_path, 'r') as f:
-        prd = json.load(f)
+    prd = read_prd(prd_path)
 
     # Get incomplete stories
     incomplete_stories = [
@@ -220,8 +220,7 @@ def validate_command(args: argparse.Namespace) -> None:
 
     # Load and validate PRD
     try:
-        with open(prd_path, 'r') as f:
-            prd = json.load(f)
+        prd = read_prd(prd_path)
     except json.JSONDecodeError as e:
         print(f"❌ Invalid JSON: {e}")
         sys.exit(1)
@@ -390,8 +389,8 @@ def list_stories_command(args: argparse.Namespace) -> None:
 
     manager = PRDManager(prd_path)
     stories = manager.list_stories(
-        phase=args.phase if hasattr(args, 'phase') and args.phase else None,
-        status=args.status if hasattr(args, 'status') and args.status else None
+        phase=args.phase or None,
+        status=args.status or None,
     )
 
     if not stories:
@@ -125,6 +125,7 @@ class RalphConfig:
                 "enableMetrics": True,
                 "useStreaming": True,
                 "useAISelection": True,
+                "liveStatusUpdates": True,  # Save PRD when a story starts (for viewers)
                 "workingDirectory": None  # None = use project_dir
             },
             "claude": {
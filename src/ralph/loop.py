@@ -8,13 +8,25 @@ Future work should split this into:
 - session_reporter.py (reporting and summaries)
 """
 
+import codecs
+import heapq
 import json
+import math
+import os
 import re
+import select
+import shutil
 import subprocess
+import sys
+import threading
 import time
+from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from ralph.utils import dump_prd, read_prd
 
 try:
     from rich.console import Console
@@ -29,147 +41,51 @@ except ImportError:
 if TYPE_CHECKING:
     from ralph.config import RalphConfig
 
+# Story ID references and Claude's story-selection JSON
+_US_ID_RE = re.compile(r'US-\d+', re.ASCII)
+_CLAUDE_SEL_RE = re.compile(r'\{[^{}]*"selectedStoryId"[^{}]*"reasoning"[^{}]*\}', re.DOTALL)
+_CLAUDE_SEL_SIMPLE_RE = re.compile(r'\{.*?"selectedStoryId".*?\}', re.DOTALL)
 
-class RalphLoop:
-    """Main Ralph execution loop."""
-
-    def __init__(self, config: "RalphConfig", verbose: bool = False):
-        """Initialize Ralph loop.
-
-        Args:
-            config: RalphConfig instance
-            verbose: Show verbose output
-        """
-        self.config = config
-        self.verbose = verbose
-        self.failure_count = 0
-        self.last_story_id: Optional[str] = None
-        self.session_start_time: Optional[float] = None
-        self.session_completed_stories: List[Dict] = []  # Stories completed in this session
-        self.initial_completed_count = 0  # Stories completed before session started
-
-    def _load_guardrails(self) -> str:
-        """Load guardrails from .ralph/guardrails.md if it exists."""
-        guardrails_path = self.config.guardrails_path
-        if guardrails_path.exists():
-            try:
-                with open(guardrails_path, 'r') as f:
-                    return f.read()
-            except Exception:
-                pass
-        return ""
-
-    def _update_guardrails(self, story: Dict, error_summary: str, failure_count: int) -> None:
-        """Update guardrails file with a new learning after repeated failures.
-
-        Only updates after 2+ consecutive failures on the same story.
-        """
-        if failure_count < 2:
-            return
-
-        guardrails_path = self.config.guardrails_path
-
-        # Create file with header if it doesn't exist
-        if not guardrails_path.exists():
-            guardrails_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(guardrails_path, 'w') as f:
-                f.write("# Guardrails\n\n")
-                f.write("Learnings from failures to prevent repeated mistakes.\n\n")
-                f.write("---\n\n")
+# Static prompt prefixes. Only project-level fields are interpolated, so the text is
+# identical across iterations and the prompt cache can reuse it; the per-iteration
+# data goes in the (much smaller) user prompt.
+_SELECTION_SYSTEM_PROMPT = """\
+You are analyzing a software project PRD to determine the optimal next user story \
+to implement.
 
-        # Append new learning
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        with open(guardrails_path, 'a') as f:
-            f.write(f"## {story['id']}: {story['title']}\n")
-            f.write(f"**Added**: {timestamp} (after {failure_count} failures)\n\n")
-            f.write(f"**Issue**:\n```\n{error_summary[:500]}\n```\n\n")
-            f.write("**Rule**: _[Agent should analyze and fill this in on next iteration]_\n\n")
-            f.write("---\n\n")
+## Project Context
 
-        if HAS_RICH and console:
-            console.print(f"[yellow]📝 Updated guardrails with learning from {story['id']}[/yellow]")
-        else:
-            print(f"📝 Updated guardrails with learning from {story['id']}")
+**Project**: {project}
+**Description**: {description}
 
-    def _get_design_doc(self, prd: Dict) -> Optional[str]:
-        """Get design document path from PRD if specified."""
-        design_doc = prd.get("designDoc", {})
-        if isinstance(design_doc, dict):
-            return design_doc.get("path")
-        elif isinstance(design_doc, str):
-            return design_doc
-        return None
+## Your Task
 
-    def _build_completed_stories_prose(self, prd: Dict) -> str:
-        """Build a prose description of what's been completed, not just IDs."""
-        completed = [s for s in prd.get("userStories", []) if s.get("status") == "complete"]
-        if not completed:
-            return ""
+Analyze the remaining stories and determine which story should be implemented next. Consider:
 
-        # Group by phase if phases exist
-        phases = prd.get("phases", {})
-        if phases:
-            by_phase: Dict[int, List[Dict]] = {}
-            for story in completed:
-                phase = story.get("phase", 1)
-                if phase not in by_phase:
-                    by_phase[phase] = []
-                by_phase[phase].append(story)
+1. **Dependencies**: Which stories depend on others? What needs to be built first?
+2. **Implementation Readiness**: What's already in the codebase that would help \
+implement each story?
+3. **Critical Path**: Which stories unlock the most other stories?
+4. **Complexity**: Which stories are foundational and should come first?
+5. **Priority**: Consider the priority field, but don't rely solely on it - use your judgment
 
-            lines = []
-            for phase_num in sorted(by_phase.keys()):
-                phase_info = phases.get(str(phase_num), {})
-                phase_name = phase_info.get("name", f"Phase {phase_num}")
-                lines.append(f"\n**{phase_name}**:")
-                for story in by_phase[phase_num]:
-                    # Use title as the main description
-                    lines.append(f"- {story['title']}")
-            return "\n".join(lines)
-        else:
-            # No phases, just list stories
-            lines = []
-            for story in completed:
-                lines.append(f"- {story['title']}")
-            return "\n".join(lines)
+## Output Format
 
-    def _generate_feature_summary(self, completed_stories: List[Dict], remaining_stories: List[Dict], prd: Dict) -> str:
-        """Generate AI-powered feature summary of what was built and what's testable."""
-        if not completed_stories:
-            return ""
+Respond with ONLY a JSON object in this exact format:
+{{
+  "selectedStoryId": "US-XXX",
+  "reasoning": "Brief explanation of why this story was selected (2-3 sentences)"
+}}
 
-        try:
-            # Build context for Claude
-            completed_details = []
-            for story_info in completed_stories:
-                # Find full story details from PRD
-                full_story = next((s for s in prd["userStories"] if s["id"] == story_info["id"]), None)
-                if full_story:
-                    completed_details.append({
-                        "id": full_story["id"],
-                        "title": full_story["title"],
-                        "description": full_story.get("description", ""),
-                        "acceptanceCriteria": full_story.get("acceptanceCriteria", [])
-                    })
 
-            # Build remaining stories context (limited)
-            remaining_details = []
-            for story in remaining_stories[:5]:  # Only first 5 for context
-                remaining_details.append({
-                    "id": story["id"],
-                    "title": story["title"]
-                })
+Be specific about why this story makes sense given the current codebase state and dependencies."""
 
-            prompt = f"""You are summarizing a software development session for the PROJECT OWNER.
+_SUMMARY_SYSTEM_PROMPT = """\
+You are summarizing a software development session for the PROJECT OWNER.
 
 ## Project Context
-**Project**: {prd.get('project', 'Unknown')}
-**Description**: {prd.get('description', '')}
-
-## Stories Completed This Session
-{json.dumps(completed_details, indent=2)}
-
-## Remaining Stories (Next Up)
-{json.dumps(remaining_details, indent=2) if remaining_details else "All stories completed!"}
+**Project**: {project}
+**Description**: {description}
 
 ## Your Task
 Write a concise, user-friendly summary that answers:
@@ -192,1194 +108,1758 @@ Return ONLY the summary text (no JSON, no headers). Use emoji sparingly for visu
 Start with "🎯 FEATURES ADDED THIS SESSION" and then bullet points.
 End with a "What's Next" section if there are remaining stories."""
 
-            # Call Claude Code CLI (uses OAuth, no API key needed)
-            from ralph.prd import call_claude_code
-
-            model = self.config.get("claude.model", "claude-opus-4-5")
-            response_text = call_claude_code(prompt, model=model, timeout=120)
+# Bytes of agent output kept in memory from each end of the stream (the rest is
+# only in the story's detail log)
+_OUTPUT_KEEP_BYTES = 4096
+
+# Rich markup for the per-story panels; only the fields vary between stories
+_SELECTION_PANEL_TMPL = (
+    "[bold magenta]Iteration {iteration}[/bold magenta]\n\n"
+    "[cyan]Story ID:[/cyan] {id}\n"
+    "[cyan]Title:[/cyan] {title}\n"
+    "[cyan]Priority:[/cyan] {priority}\n"
+    "[dim]Remaining: {remaining} stories[/dim]"
+)
+_AGENT_PANEL_TMPL = (
+    "[bold cyan]Story {id}: {title}[/bold cyan]\n"
+    "[dim]Iteration {iteration}[/dim]\n"
+    "[dim]Log file: {log}[/dim]"
+)
+_FAILURE_PANEL_TMPL = "[bold red]{error}[/bold red]\n[dim]Check log: {log}[/dim]"
+_SUCCESS_PANEL_TMPL = (
+    "[bold green]✓ Story {id} completed successfully![/bold green]\n\n"
+    "[cyan]Title:[/cyan] {title}\n"
+    "[cyan]Total time:[/cyan] {duration:.1f}s\n"
+    "[cyan]Log file:[/cyan] {log}"
+)
+_COMMIT_PANEL_TMPL = (
+    "[bold green]✓ Changes committed[/bold green]\n\n"
+    "[cyan]Branch:[/cyan] {branch}\n"
+    "[cyan]Message:[/cyan] {message}\n"
+    "[dim]Working directory: {cwd}[/dim]"
+)
+
+# Static instructions closing every agent prompt (nothing story-specific)
+_AGENT_PROMPT_TAIL = """
+## Implementation Strategy
 
-            return response_text
+Follow this incremental approach:
 
-        except Exception as e:
-            # If AI summary fails, return empty string (fall back to mechanical summary)
-            print(f"   ⚠️  Could not generate feature summary: {e}")
-            return ""
+1. **Explore First** (5-10 minutes)
+   - Read existing codebase to understand structure and patterns
+   - Identify what utilities/helpers already exist
+   - Check what dependencies are available
+   - Understand how similar features are implemented
 
-    def _print_session_summary(self, prd: Dict, iteration_count: int, _prd_path: Path) -> None:
-        """Print comprehensive session summary at the end of execution."""
-        session_duration = time.time() - self.session_start_time if self.session_start_time else 0
+2. **Plan Implementation** (2-3 minutes)
+   - Break down acceptance criteria into concrete tasks
+   - Identify which files need to be created/modified
+   - **Determine what tests are needed (BOTH unit tests with mocks AND E2E tests with real integrations!)**
+   - Plan E2E tests FIRST - they verify actual functionality
+   - Consider edge cases and error handling
 
-        # Get file changes from git
-        changed_files = []
-        try:
-            result = subprocess.run(
-                ["git", "diff", "--name-only", "HEAD"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            if result.returncode == 0:
-                changed_files = [f for f in result.stdout.strip().split('\n') if f]
-        except Exception:
-            pass
+3. **Implement Incrementally** (iterative)
+   - Start with core functionality first
+   - Build one acceptance criterion at a time
+   - Test each piece as you build it
+   - Follow existing code patterns and conventions
+   - Keep files modular and focused (see file size guidance below)
 
-        # Calculate stats
-        total_stories = len(prd["userStories"])
-        current_completed = sum(1 for s in prd["userStories"] if s.get("status") == "complete")
-        remaining_stories = total_stories - current_completed
-        session_completed_count = len(self.session_completed_stories)
+4. **Verify Quality** (before finishing)
+   - Run all acceptance criteria against your implementation
+   - **Run E2E tests with real integrations (CRITICAL!) - this catches issues mocks miss**
+   - Ensure code is clean and maintainable
+   - Check that both E2E tests and unit tests exist and pass
+   - Verify type safety and error handling
+   - Check file sizes and refactor if needed (see file size guidance below)
 
-        # Generate AI feature summary first if we completed stories
-        feature_summary = ""
-        if session_completed_count > 0:
-            remaining = [s for s in prd["userStories"] if s.get("status", "incomplete") not in ("complete", "skipped")]
-            feature_summary = self._generate_feature_summary(
-                self.session_completed_stories,
-                remaining,
-                prd
-            )
+## Auto-Installation of Missing Dependencies
 
-        # Print summary
-        print("\n" + "="*80)
-        print("📊 SESSION SUMMARY")
-        print("="*80)
+**IMPORTANT**: If you encounter errors running commands due to missing tools or packages, you have permission to install them automatically.
 
-        # Session stats
-        hours = int(session_duration // 3600)
-        minutes = int((session_duration % 3600) // 60)
-        seconds = int(session_duration % 60)
-        duration_str = f"{hours}h {minutes}m {seconds}s" if hours > 0 else f"{minutes}m {seconds}s"
+### When to Auto-Install
 
-        print(f"\n⏱️  Duration: {duration_str}")
-        print(f"🔄 Iterations: {iteration_count}")
+If a command fails with errors like:
+- "command not found"
+- "No such file or directory"
+- "package not found"
+- Missing executables or tools
 
-        # Print AI-generated feature summary if available
-        if feature_summary:
-            print("\n" + "-"*80)
-            print(feature_summary)
-            print("-"*80)
+### How to Install
 
-        # Stories completed this session (technical details)
-        if session_completed_count > 0:
-            print(f"\n✅ Completed This Session ({session_completed_count} stories):")
-            for story_info in self.session_completed_stories:
-                print(f"   • {story_info['id']}: {story_info['title']} ({story_info['duration']:.1f}s)")
-        else:
-            print(f"\n⚠️  No stories completed this session")
+**On macOS (detected by `uname -s` == "Darwin"):**
+- Use Homebrew: `brew install <package-name>`
+- For Python packages: `pip install <package>` or `uv pip install <package>`
+- For Node packages: `npm install -g <package>` or `npm install <package>`
+- For system tools: `brew install <tool>`
 
-        # Files changed
-        if changed_files:
-            print(f"\n📝 Files Changed ({len(changed_files)} files):")
-            # Group by directory and show top 10
-            display_files = changed_files[:10]
-            for f in display_files:
-                print(f"   • {f}")
-            if len(changed_files) > 10:
-                print(f"   ... and {len(changed_files) - 10} more")
+**On Linux (detected by `uname -s` == "Linux"):**
+- Use apt: `sudo apt-get update && sudo apt-get install -y <package>`
+- Use yum/dnf: `sudo yum install -y <package>` or `sudo dnf install -y <package>`
+- For Python packages: `pip install <package>` or `pip3 install <package>`
+- For Node packages: `npm install -g <package>` or `npm install <package>`
 
-        # Overall PRD status
-        print(f"\n📋 Overall Progress:")
-        print(f"   Total Stories: {total_stories}")
-        print(f"   Completed: {current_completed} ({100*current_completed//total_stories if total_stories > 0 else 0}%)")
-        print(f"   Remaining: {remaining_stories}")
+**General Guidelines:**
+- Check if tool exists first: `which <tool>` or `command -v <tool>`
+- Install missing dependencies before retrying the failed command
+- For Python projects, check if virtual environment needs activation
+- For Node projects, check if `node_modules` needs installation
+- You have permission to use `sudo` when needed for system packages
 
-        if remaining_stories > 0:
-            print(f"\n📌 Next Stories to Complete:")
-            remaining = [s for s in prd["userStories"] if s.get("status", "incomplete") not in ("complete", "skipped")]
-            for story in remaining[:3]:  # Show next 3
-                print(f"   • {story['id']}: {story['title']}")
-            if len(remaining) > 3:
-                print(f"   ... and {len(remaining) - 3} more")
+### Examples
 
-        # Next steps
-        print(f"\n💡 Next Steps:")
-        if remaining_stories > 0:
-            print(f"   Run: python ralph.py execute-plan")
-            print(f"   Or: python ralph.py status")
-        else:
-            print(f"   All stories complete! Review and merge your changes.")
+```bash
+# If `jq` command not found:
+brew install jq  # macOS
+sudo apt-get install -y jq  # Linux
 
-        print("\n" + "="*80 + "\n")
+# If Python package missing:
+pip install missing-package
+# or
+uv pip install missing-package
 
-    def show_info(self, prd_path: Optional[Path] = None, phase: Optional[int] = None) -> None:
-        """Show startup banner and PRD info without executing anything."""
-        from ralph.utils import show_ralph_banner
+# If Node command not found:
+npm install -g typescript
 
-        prd_path = prd_path or self.config.prd_path
+# If git command fails, check if git is installed:
+which git || brew install git  # macOS
+```
 
-        if not prd_path.exists():
-            raise FileNotFoundError(f"PRD file not found: {prd_path}")
+**Always retry the original command after installation to verify it works.**
 
-        # Load PRD
-        with open(prd_path, 'r') as f:
-            prd = json.load(f)
+## File Size and Modularity
 
-        max_iter = self.config.get("ralph.maxIterations", 20)
-        max_failures = self.config.get("ralph.maxFailures", 3)
+**CRITICAL**: Keep code files small, focused, and maintainable.
 
-        # Display Ralph ASCII art
-        show_ralph_banner()
+### File Size Limits
+- **Maximum file size**: 500 lines (including imports, docstrings, and whitespace)
+- **Target file size**: 200-300 lines for most files
+- **If a file exceeds 500 lines**: Refactor it immediately into smaller modules
 
-        # Display phase info if filtering by phase
-        phase_info = ""
-        if phase is not None:
-            phase_info = f"\n   🎯 Phase Filter: Phase {phase}"
+### When to Split Files
 
-        print(f"\n🚀 Ralph - Autonomous AI Agent Loop")
-        print(f"   Project: {prd.get('project', 'Unknown')}")
-        print(f"   Branch: {prd.get('branchName', 'N/A')}")
-        print(f"   Max iterations: {max_iter if max_iter > 0 else 'unlimited'}")
-        print(f"   Max consecutive failures: {max_failures}")
+Split a file when:
+- It exceeds 500 lines
+- It contains multiple unrelated responsibilities
+- It has more than 5-7 classes or 10-15 functions
+- It handles multiple distinct concerns
 
-        # Count stories
-        all_stories = prd.get('userStories', [])
-        completed = sum(1 for s in all_stories if s.get('status') == 'complete')
-        total = len(all_stories)
+### How to Refactor Large Files
 
-        stories_to_complete = [s for s in all_stories if s.get('status', 'incomplete') not in ('complete', 'skipped')]
-        if phase is not None:
-            stories_to_complete = [s for s in stories_to_complete if s.get('phase') == phase]
+1. **Identify logical groupings**: Group related functions/classes together
+2. **Extract into separate modules**: Create new files for each logical grouping
+3. **Use clear naming**: Module names should clearly indicate their purpose
+4. **Update imports**: Ensure all imports are updated correctly
+5. **Maintain public API**: Use `__init__.py` to re-export if needed
 
-        print(f"   Progress: {completed}/{total} stories ({completed/total*100:.0f}%)")
-        print(f"   Stories to complete: {len(stories_to_complete)}{phase_info}")
+### Examples of Good File Organization
 
-        # Show phases summary (derived from stories)
-        phases_from_stories: Dict[int, List[Dict]] = {}
-        for story in all_stories:
-            p = story.get("phase", 0)
-            if p not in phases_from_stories:
-                phases_from_stories[p] = []
-            phases_from_stories[p].append(story)
-
-        if phases_from_stories and HAS_RICH:
-            print()
-            for phase_num in sorted(phases_from_stories.keys()):
-                if phase_num == 0:
-                    continue  # Skip unphased stories in summary
-                phase_stories = phases_from_stories[phase_num]
-                phase_completed = sum(1 for s in phase_stories if s.get("status") == "complete")
-                phase_total = len(phase_stories)
-                if phase_completed == phase_total:
-                    status = "✅"
-                elif phase_completed > 0:
-                    status = "🔄"
-                else:
-                    status = "⏳"
-                print(f"   {status} Phase {phase_num} ({phase_completed}/{phase_total})")
+**Bad** (one large file):
+```
+slack_bot/client.py  (800 lines)
+- Socket mode connection
+- Event handlers
+- Message formatting
+- User management
+- Channel management
+- Error handling
+- Logging setup
+```
 
-        # Show next story
-        if stories_to_complete:
-            next_story = min(stories_to_complete, key=lambda s: (s.get('phase', 999), s.get('priority', 999)))
-            print(f"\n   ➡️  Next: {next_story['id']} - {next_story['title']}")
+**Good** (split into focused modules):
+```
+slack_bot/
+├── client.py           (150 lines) - Main client and connection
+├── events.py           (200 lines) - Event handlers
+├── formatting.py       (120 lines) - Message formatting
+├── users.py            (180 lines) - User management
+├── channels.py         (150 lines) - Channel management
+└── errors.py           (100 lines) - Error handling
+```
 
-        print(f"\n   💡 To execute: python ralph.py execute-plan" + (f" --phase {phase}" if phase else ""))
-        print()
+### Proactive Refactoring
 
-    def execute(self, prd_path: Optional[Path] = None, max_iterations: Optional[int] = None, phase: Optional[int] = None) -> None:
-        """Execute Ralph loop until completion or max iterations.
+**Before creating new code:**
+- Check if existing files in the area are approaching 500 lines
+- If so, refactor them first before adding new functionality
+- This prevents files from growing too large
 
-        Args:
-            prd_path: Path to prd.json file
-            max_iterations: Maximum number of iterations (0 = unlimited)
-            phase: Only execute stories in this phase (None = all incomplete stories)
-        """
-        from ralph.utils import show_ralph_banner
+**When adding to existing files:**
+- Check current file size first
+- If adding would exceed 500 lines, refactor before adding
+- Consider if the new code belongs in a separate module
 
-        prd_path = prd_path or self.config.prd_path
+### File Size Check
 
-        if not prd_path.exists():
-            raise FileNotFoundError(f"PRD file not found: {prd_path}")
+Before finishing your implementation:
+1. Check line count of all modified/created files: `wc -l <file>`
+2. If any file exceeds 500 lines, refactor it into smaller modules
+3. Ensure each module has a single, clear responsibility
+4. Update all imports and ensure tests still pass
 
-        # Load PRD
-        with open(prd_path, 'r') as f:
-            prd = json.load(f)
+## Quality Requirements & Testing
 
-        # Track session start
-        self.session_start_time = time.time()
+**CRITICAL**: Ensure your implementation meets quality standards.
 
-        # Track initial state
-        self.initial_completed_count = sum(1 for s in prd["userStories"] if s.get("status") == "complete")
+### Type Safety
+- Add type hints to all function signatures
+- Use strict typing (no `Any` unless absolutely necessary)
+- Ensure mypy/pyright passes with no errors
+- Import types from `typing` module as needed
 
-        max_iter = max_iterations or self.config.get("ralph.maxIterations", 20)
-        max_failures = self.config.get("ralph.maxFailures", 3)
+### Testing Strategy
 
-        # Display Ralph ASCII art
-        show_ralph_banner()
+**CRITICAL**: You MUST implement BOTH unit tests AND end-to-end tests. E2E tests are the most important!
 
-        # Display phase info if filtering by phase
-        phase_info = ""
-        if phase is not None:
-            phase_info = f"\n   🎯 Phase Filter: Phase {phase}"
+#### 1. End-to-End (E2E) Tests - **REQUIRED**
+- **Purpose**: Verify the ACTUAL functionality works with real integrations
+- **What to test**: Full user-facing workflows with real external systems
+- **Examples**:
+  - CLI that calls Anthropic API → Test with REAL API calls
+  - Database operations → Test with REAL database
+  - File I/O → Test with REAL file system
+  - Network requests → Test with REAL endpoints (or local test servers)
+- **How to mark**: Use `@pytest.mark.e2e` decorator
+- **API Keys**: Use `@pytest.mark.skipif(not os.getenv('API_KEY'))` to skip if missing
+- **Critical**: E2E tests catch issues that mocks miss (model names, API changes, auth issues)
 
-        print(f"\n🚀 Starting Ralph Loop")
-        print(f"   Max iterations: {max_iter if max_iter > 0 else 'unlimited'}")
-        print(f"   Max consecutive failures: {max_failures}")
+#### 2. Unit Tests - Use Mocks
+- **Purpose**: Test individual functions and classes in isolation
+- **When to mock**: External APIs, databases, network calls (but only in unit tests!)
+- **Examples**: `@patch('anthropic.Anthropic')`, `@patch('requests.get')`
 
-        # Count stories to complete (with optional phase filter)
-        stories_to_complete = [s for s in prd['userStories'] if s.get('status', 'incomplete') not in ('complete', 'skipped')]
-        if phase is not None:
-            stories_to_complete = [s for s in stories_to_complete if s.get('phase') == phase]
+#### 3. Integration Tests
+- **Purpose**: Test how components work together (but may still use test doubles)
+- **Examples**: Multiple modules interacting, data flowing through system
 
-        print(f"   Stories to complete: {len(stories_to_complete)}{phase_info}\n")
-        
-        iteration = 0
-        
+#### 4. Edge Cases
+- **Purpose**: Test boundary conditions, empty inputs, error states
+
+**Test file naming**: `test_<module_name>.py` or `test_<feature>_e2e.py` for E2E tests
+
+**Running tests**:
+```bash
+pytest tests/              # Run all tests
+pytest tests/ -m e2e       # Run only E2E tests
+pytest tests/ -m "not e2e" # Run only unit/integration tests
+```
+
+### Code Quality
+- Follow existing code patterns and conventions
+- Keep functions small and focused (< 50 lines)
+- Use descriptive variable and function names
+- Add docstrings for public functions and classes
+- Handle errors gracefully with try/except where appropriate
+- No commented-out code or debug print statements
+- Clean up imports (no unused imports)
+
+### Linting & Formatting
+- Code must pass linting (ruff, pylint, or project-specific linter)
+- Follow PEP 8 style guidelines
+- Use consistent formatting (spaces, line breaks, etc.)
+- Maximum line length: 100-120 characters
+
+### Self-Review Checklist
+
+Before finishing, verify:
+- [ ] All acceptance criteria are met
+- [ ] Type hints added to all functions
+- [ ] **END-TO-END TESTS written and passing** (with real integrations - CRITICAL!)
+- [ ] Unit tests written and passing (with mocks for external dependencies)
+- [ ] **All files are under 500 lines** (check with `wc -l`)
+- [ ] Large files refactored into smaller, focused modules
+- [ ] No obvious bugs or edge cases missed
+- [ ] Error handling is appropriate
+- [ ] Code follows existing patterns
+- [ ] No debug code or print statements left in
+- [ ] Documentation/comments added where needed
+
+**CRITICAL REMINDER**: If your feature calls external APIs, databases, or services, you MUST have E2E tests that verify it works with the REAL system. Mocked unit tests alone are NOT sufficient!
+
+## Output Format
+
+After implementing, provide a summary with:
+
+**✅ Implemented:**
+- List of acceptance criteria met
+- Key files created/modified
+- File sizes (line counts) for all new/modified code files
+
+**🧪 Tests:**
+- **E2E tests**: List E2E test files and what they verify (REQUIRED if feature has external integrations)
+- **Unit tests**: List unit test files and coverage
+- Test coverage areas
+- How to run the tests (including how to run E2E tests with API keys)
+
+**🔧 Refactoring:**
+- Any files that were split/refactored due to size
+- Any proactive refactoring done to keep files under 500 lines
+
+**📝 Notes:**
+- Any important patterns or decisions made
+- Dependencies added
+- Known limitations or future improvements needed
+
+## Continuous Improvement: Skills & Documentation
+
+As you work, you should continuously improve the codebase's tooling and documentation.
+
+### Creating Claude Code Skills
+
+**IMPORTANT**: Create skills in `.claude/skills/` for reusable operations you discover or implement.
+
+Skills make future work faster and more reliable. Create a skill when you:
+- Run the same sequence of commands repeatedly (build, test, deploy)
+- Discover project-specific patterns or workflows
+- Implement something that would help future agents
+
+**Skill structure** (create in `.claude/skills/<skill-name>/SKILL.md`):
+```yaml
+---
+name: skill-name-kebab-case
+description: Brief description of when to use this skill (triggers automatic loading)
+---
+
+# Skill Name
+
+## Quick Start
+[Most common usage pattern]
+
+## Commands
+[Key commands with explanations]
+
+## Examples
+[Concrete examples]
+
+## Common Issues
+[Troubleshooting tips]
+```
+
+**Skills to consider creating:**
+- `build` - How to build the project
+- `test` - How to run tests (unit, E2E, specific modules)
+- `lint` - How to lint and auto-fix
+- `deploy` - Deployment steps if applicable
+- `db-migrate` - Database migration commands
+- Project-specific workflows
+
+**Example skill** (`.claude/skills/test/SKILL.md`):
+```yaml
+---
+name: test
+description: Run tests for this project. Use when asked to test, verify, or check code works.
+---
+
+# Testing
+
+## Quick Start
+```bash
+pytest tests/           # All tests
+pytest tests/ -m e2e    # E2E tests only (requires API keys)
+```
+
+## Test Categories
+- Unit tests: `pytest tests/ -m "not e2e"`
+- E2E tests: `ANTHROPIC_API_KEY=xxx pytest -m e2e`
+
+## Coverage
+```bash
+pytest --cov=src --cov-report=html
+```
+```
+
+### Updating AGENTS.md
+
+**IMPORTANT**: If you discover important codebase patterns, conventions, or knowledge that would help future agents, update `AGENTS.md`.
+
+Add to AGENTS.md when you discover:
+- Project structure patterns
+- Naming conventions
+- Architecture decisions
+- Common gotchas or pitfalls
+- Key dependencies and how they're used
+- Testing patterns specific to this project
+
+This helps future agents (and humans) work more effectively in this codebase.
+
+Begin implementation now."""
+
+
+# Statuses that take a story out of the work queue
+_TERMINAL_STATUSES = frozenset({"complete", "skipped"})
+
+
+def _next_story_key(story: Dict) -> Tuple[Any, Any]:
+    """Sort key for picking the next stories to work on: phase, then priority."""
+    return (story.get('phase', 999), story.get('priority', 999))
+
+
+def _iter_strings(value: Any) -> Iterator[str]:
+    """Yield every string (dict keys included) nested anywhere in a JSON value."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key)
+            yield from _iter_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_strings(item)
+
+
+def _tail_lines(path: Path, n: int = 50) -> str:
+    """Return the last n lines of a file, reading backwards from the end.
+
+    Reads 8 KiB from the end and doubles the window until it holds more than n
+    newlines (or reaches the start), so cost tracks the tail, not the file size.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        window = 8192
         while True:
-            iteration += 1
-            
-            # Check max iterations
-            if max_iter > 0 and iteration > max_iter:
-                print(f"\n⚠️  Max iterations ({max_iter}) reached")
+            start = max(0, size - window)
+            f.seek(start)
+            data = f.read(size - start)
+            if start == 0 or data.count(b"\n") > n:
                 break
-            
-            # Check for remaining stories (with optional phase filter)
-            remaining_stories = [s for s in prd["userStories"] if s.get("status", "incomplete") not in ("complete", "skipped")]
-            if phase is not None:
-                remaining_stories = [s for s in remaining_stories if s.get("phase") == phase]
+            window *= 2
+    return b"".join(data.splitlines(keepends=True)[-n:]).decode("utf-8", errors="replace")
 
-            if not remaining_stories:
-                if phase is not None:
-                    print(f"\n✅ All Phase {phase} stories completed!")
-                else:
-                    print("\n✅ All stories completed!")
-                break
-            
-            # Check failure threshold
-            if self.failure_count >= max_failures:
-                print(f"\n❌ Stopping: {max_failures} consecutive failures")
-                break
-            
-            # Select next story
-            story = self._select_next_story(remaining_stories, prd)
 
-            if HAS_RICH and console:
-                console.print("\n")
-                console.print(Panel(
-                    f"[bold magenta]Iteration {iteration}[/bold magenta]\n\n"
-                    f"[cyan]Story ID:[/cyan] {story['id']}\n"
-                    f"[cyan]Title:[/cyan] {story['title']}\n"
-                    f"[cyan]Priority:[/cyan] {story.get('priority', 'N/A')}\n"
-                    f"[dim]Remaining: {len(remaining_stories)} stories[/dim]",
-                    title="📋 Story Selection",
-                    border_style="magenta"
-                ))
-            else:
-                print(f"\n{'='*60}")
-                print(f"  Iteration {iteration} - {story['id']}: {story['title']}")
-                print(f"{'='*60}")
+def _read_tail(stream: BinaryIO, tail: bytearray, limit: int = _OUTPUT_KEEP_BYTES) -> None:
+    """Drain a pipe to EOF, keeping only its last `limit` bytes in `tail`."""
+    for chunk in iter(lambda: stream.read1(65536), b""):  # type: ignore[attr-defined]
+        tail.extend(chunk)
+        del tail[:-limit]
 
-            iteration_start = time.time()
 
-            # Mark story as in-progress and save PRD (so viewers can see it)
-            story["status"] = "in_progress"
-            story["startedAt"] = datetime.now().isoformat()
-            prd["metadata"]["lastUpdatedAt"] = datetime.now().isoformat()
-            with open(prd_path, 'w') as f:
-                json.dump(prd, f, indent=2)
+def _branch_from_status_header(header: str) -> str:
+    """Extract the branch name from a `git status --porcelain -b` header line."""
+    header = header[3:] if header.startswith("## ") else header
+    for prefix in ("No commits yet on ", "Initial commit on "):
+        if header.startswith(prefix):
+            return header[len(prefix):]
+    return header.split("...", 1)[0].split(" ", 1)[0]
 
-            # Execute story
-            success = self._execute_story(story, prd, iteration)
-            
-            iteration_duration = time.time() - iteration_start
-            
-            if success:
-                self.failure_count = 0  # Reset failure count on success
-                story["status"] = "complete"
-                # Track completed story in this session
-                self.session_completed_stories.append({
-                    "id": story["id"],
-                    "title": story["title"],
-                    "duration": iteration_duration
-                })
-                story["actualDuration"] = iteration_duration
-                story["iterationNumber"] = iteration
-                
-                # Update PRD metadata
-                prd["metadata"]["completedStories"] = sum(
-                    1 for s in prd["userStories"] if s.get("status") == "complete"
-                )
-                prd["metadata"]["currentIteration"] = iteration
-                prd["metadata"]["lastUpdatedAt"] = datetime.now().isoformat()
-                
-                # Save PRD
-                with open(prd_path, 'w') as f:
-                    json.dump(prd, f, indent=2)
-                
-                print(f"✅ Story {story['id']} completed ({iteration_duration:.1f}s)")
-            else:
-                self.failure_count += 1
-                print(f"❌ Story {story['id']} failed ({iteration_duration:.1f}s)")
-                print(f"   Consecutive failures: {self.failure_count}/{max_failures}")
-
-                # Update guardrails after 2+ consecutive failures on same story
-                if self.failure_count >= 2 and self.last_story_id == story['id']:
-                    # Get error summary from the progress file (last failure logged)
-                    progress_file = self.config.progress_path
-                    error_summary = ""
-                    if progress_file.exists():
-                        with open(progress_file, 'r') as f:
-                            lines = f.readlines()
-                            # Get last 20 lines for error context
-                            error_summary = "".join(lines[-20:])
-                    self._update_guardrails(story, error_summary, self.failure_count)
-            
-            # Brief pause between iterations
-            time.sleep(2)
-        
-        # Print session summary
-        self._print_session_summary(prd, iteration, prd_path)
-    
-    def _select_next_story(self, stories: List[Dict], prd: Dict) -> Dict:
-        """Select next story using AI analysis or simple priority-based selection."""
-        # Check if AI-powered selection is enabled
-        use_ai_selection = self.config.get("ralph.useAISelection", True)
-        
-        if use_ai_selection:
-            try:
-                return self._select_next_story_with_claude(stories, prd)
-            except Exception as e:
-                print(f"   ⚠️  AI selection failed: {e}")
-                print(f"   Falling back to simple priority-based selection...")
-                # Fall through to simple selection
-        
-        # Simple priority-based selection (fallback)
-        return self._select_next_story_simple(stories, prd)
-    
-    def _select_next_story_simple(self, stories: List[Dict], prd: Dict) -> Dict:
-        """Select next story based on priority and dependencies (simple heuristic)."""
-        # Sort by priority
-        stories.sort(key=lambda s: s.get("priority", 999))
-        
-        # Filter by dependencies (simple heuristic)
-        runnable = []
-        for story in stories:
-            # Check if story mentions other story IDs that aren't complete
-            story_text = json.dumps(story)
-            mentioned_ids = re.findall(r'US-\d+', story_text)
-            
-            dependencies_satisfied = True
-            for dep_id in mentioned_ids:
-                if dep_id != story["id"]:
-                    dep_story = next((s for s in prd["userStories"] if s["id"] == dep_id), None)
-                    if dep_story and dep_story.get("status", "incomplete") not in ("complete", "skipped"):
-                        dependencies_satisfied = False
-                        break
-            
-            if dependencies_satisfied:
-                runnable.append(story)
-        
-        return runnable[0] if runnable else stories[0]
-    
-    def _select_next_story_with_claude(self, stories: List[Dict], prd: Dict) -> Dict:
-        """Use Claude to intelligently select the next story based on codebase analysis."""
-        from ralph.prd import call_claude_code
 
-        print("🧠 Analyzing stories with Claude to select optimal next task...")
-        
-        # Build summary of remaining stories
-        remaining_stories_summary = []
-        for story in stories:
-            remaining_stories_summary.append({
-                "id": story["id"],
-                "title": story["title"],
-                "description": story.get("description", ""),
-                "priority": story.get("priority", 999),
-                "acceptanceCriteria": story.get("acceptanceCriteria", [])
-            })
-        
-        # Get completed stories
-        completed_stories = [s for s in prd["userStories"] if s.get("status") == "complete"]
-        completed_ids = [s["id"] for s in completed_stories]
-        
-        # Get codebase structure (list key files/directories)
-        codebase_summary = self._get_codebase_summary(prd)
-        
-        # Build prompt for Claude
-        prompt = f"""You are analyzing a software project PRD to determine the optimal next user story to implement.
+@lru_cache(maxsize=8)
+def _project_system_prompt(template: str, project: str, description: str) -> str:
+    """Fill a static prompt prefix with project-level fields (memoized per project)."""
+    return template.format(project=project, description=description)
 
-## Project Context
 
-**Project**: {prd.get('project', 'Unknown')}
-**Description**: {prd.get('description', 'No description')}
+class _StoryPrefetch:
+    """Selects the next story on a daemon thread.
 
-**Completed Stories**: {', '.join(completed_ids) if completed_ids else 'None'}
+    A daemon thread (rather than an executor worker, which is joined at
+    interpreter exit) means an interrupt never waits on an in-flight selection.
+    """
 
-## Current Codebase Structure
+    def __init__(self, select: Callable[[], Tuple[Dict, List[str]]]) -> None:
+        self._select = select
+        self._result: Optional[Tuple[Dict, List[str]]] = None
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
-{codebase_summary}
+    def _run(self) -> None:
+        try:
+            self._result = self._select()
+        except BaseException as e:
+            self._error = e
 
-## Remaining Stories
+    def result(self) -> Tuple[Dict, List[str]]:
+        """Wait for the selection; return the story and its buffered progress lines."""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        assert self._result is not None
+        return self._result
 
-{json.dumps(remaining_stories_summary, indent=2)}
 
-## Your Task
+class RalphLoop:
+    """Main Ralph execution loop."""
 
-Analyze the remaining stories and determine which story should be implemented next. Consider:
+    def __init__(self, config: "RalphConfig", verbose: bool = False):
+        """Initialize Ralph loop.
 
-1. **Dependencies**: Which stories depend on others? What needs to be built first?
-2. **Implementation Readiness**: What's already in the codebase that would help implement each story?
-3. **Critical Path**: Which stories unlock the most other stories?
-4. **Complexity**: Which stories are foundational and should come first?
-5. **Priority**: Consider the priority field, but don't rely solely on it - use your judgment
+        Args:
+            config: RalphConfig instance
+            verbose: Show verbose output
+        """
+        self.config = config
+        self.verbose = verbose
+        self.failure_count = 0
+        self.last_story_id: Optional[str] = None
+        self.session_start_time: Optional[float] = None
+        self.session_completed_stories: List[Dict] = []  # Stories completed in this session
+        self.initial_completed_count = 0  # Stories completed before session started
+        # Codebase summary, rebuilt only when the working directory's mtime changes
+        self._codebase_cache: Dict[str, Any] = {"path": None, "mtime": None, "summary": None}
+        self._story_by_id: Dict[str, Dict] = {}  # Story ID -> story dict of the loaded PRD
+        self._indexed_stories: Optional[List[Dict]] = None  # Story list _story_by_id was built from
+        self._git_bin = shutil.which("git")  # Resolved once; None if git isn't installed
+        # Progress log O_APPEND descriptor, opened on first write and kept for the session
+        self._progress_fd: Optional[int] = None
+        # Completed-stories prose, rebuilt only when the set of completed stories changes
+        self._completed_prose_cache: Optional[Tuple[Tuple[Any, ...], str]] = None
+        # Path -> (mtime_ns, size, content) for context files re-read every iteration
+        self._file_cache: Dict[Path, Tuple[int, int, str]] = {}
+
+    def _refresh_story_index(self, prd: Dict) -> None:
+        """Rebuild the story ID index (status changes are in place, so entries stay valid)."""
+        self._indexed_stories = prd["userStories"]
+        self._story_by_id = {s["id"]: s for s in self._indexed_stories}
+
+    def _story_index(self, prd: Dict) -> Dict[str, Dict]:
+        """Return the story ID index for prd, rebuilding it if its story list changed."""
+        stories = prd["userStories"]
+        if stories is not self._indexed_stories or len(stories) != len(self._story_by_id):
+            self._refresh_story_index(prd)
+        return self._story_by_id
+
+    def _read_cached(self, path: Path, load: Callable[[Path], str] = Path.read_text) -> Optional[str]:
+        """Load a file through a cache keyed by its mtime and size.
 
-## Output Format
+        Args:
+            path: File to read
+            load: Function turning the path into the cached string
 
-Respond with ONLY a JSON object in this exact format:
-{{
-  "selectedStoryId": "US-XXX",
-  "reasoning": "Brief explanation of why this story was selected (2-3 sentences)"
-}}
+        Returns:
+            The loaded content, or None if the file doesn't exist
+        """
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._file_cache.pop(path, None)
+            return None
+        cached = self._file_cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        content = load(path)
+        self._file_cache[path] = (st.st_mtime_ns, st.st_size, content)
+        return content
+
+    def _load_guardrails(self) -> str:
+        """Load guardrails from .ralph/guardrails.md if it exists."""
+        try:
+            return self._read_cached(self.config.guardrails_path) or ""
+        except Exception:
+            return ""
+
+    def _update_guardrails(self, story: Dict, error_summary: str, failure_count: int) -> None:
+        """Update guardrails file with a new learning after repeated failures.
+
+        Only updates after 2+ consecutive failures on the same story.
+        """
+        if failure_count < 2:
+            return
+
+        guardrails_path = self.config.guardrails_path
+
+        # Append new learning, writing the header first if the file is new
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        guardrails_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(guardrails_path, 'a') as f:
+            if f.tell() == 0:
+                f.write("# Guardrails\n\n")
+                f.write("Learnings from failures to prevent repeated mistakes.\n\n")
+                f.write("---\n\n")
+            f.write(f"## {story['id']}: {story['title']}\n")
+            f.write(f"**Added**: {timestamp} (after {failure_count} failures)\n\n")
+            f.write(f"**Issue**:\n```\n{error_summary[:500]}\n```\n\n")
+            f.write("**Rule**: _[Agent should analyze and fill this in on next iteration]_\n\n")
+            f.write("---\n\n")
+
+        if HAS_RICH and console:
+            console.print(f"[yellow]📝 Updated guardrails with learning from {story['id']}[/yellow]")
+        else:
+            print(f"📝 Updated guardrails with learning from {story['id']}")
+
+    def _get_design_doc(self, prd: Dict) -> Optional[str]:
+        """Get design document path from PRD if specified."""
+        design_doc = prd.get("designDoc", {})
+        if isinstance(design_doc, dict):
+            return design_doc.get("path")
+        elif isinstance(design_doc, str):
+            return design_doc
+        return None
+
+    def _build_completed_stories_prose(self, prd: Dict) -> str:
+        """Build a prose description of what's been completed, not just IDs."""
+        completed = [s for s in prd.get("userStories", []) if s.get("status") == "complete"]
+        if not completed:
+            return ""
 
+        key = tuple(s.get("id") for s in completed)
+        cache = self._completed_prose_cache
+        if cache is not None and cache[0] == key:
+            return cache[1]
 
-Be specific about why this story makes sense given the current codebase state and dependencies."""
+        prose = self._format_completed_stories_prose(completed, prd.get("phases", {}))
+        self._completed_prose_cache = (key, prose)
+        return prose
 
-        # Call Claude Code CLI (uses OAuth, no API key needed)
-        model = self.config.get("claude.model", "claude-opus-4-5")
+    @staticmethod
+    def _format_completed_stories_prose(completed: List[Dict], phases: Dict) -> str:
+        """Format completed stories as markdown, grouped by phase when phases exist."""
 
-        response_text = call_claude_code(prompt, model=model, timeout=120)
-        
-        # Extract JSON from response (handle multi-line JSON)
-        json_match = re.search(r'\{[^{}]*"selectedStoryId"[^{}]*"reasoning"[^{}]*\}', response_text, re.DOTALL)
-        if not json_match:
-            # Try simpler pattern
-            json_match = re.search(r'\{.*?"selectedStoryId".*?\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                selection = json.loads(json_match.group())
-                selected_id = selection.get("selectedStoryId")
-                reasoning = selection.get("reasoning", "No reasoning provided")
-                
-                if selected_id:
-                    # Find the story
-                    selected_story = next((s for s in stories if s["id"] == selected_id), None)
-                    if selected_story:
-                        print(f"   ✅ Selected: {selected_id} - {selected_story['title']}")
-                        print(f"   💭 Reasoning: {reasoning}")
-                        return selected_story
-                    else:
-                        print(f"   ⚠️  Selected story {selected_id} not found in remaining stories")
-            except json.JSONDecodeError as e:
-                print(f"   ⚠️  Failed to parse Claude response: {e}")
-        
-        # Fallback if parsing fails
-        print(f"   ⚠️  Could not parse Claude selection, falling back to simple selection")
-        return self._select_next_story_simple(stories, prd)
-    
-    def _get_codebase_summary(self, prd: Dict) -> str:
-        """Get a summary of the current codebase structure."""
-        # Get working directory from config (defaults to current directory)
-        working_dir = self.config.get("ralph.workingDirectory", ".")
+        # Group by phase if phases exist
+        if phases:
+            by_phase: Dict[int, List[Dict]] = defaultdict(list)
+            for story in completed:
+                by_phase[story.get("phase", 1)].append(story)
 
-        if not working_dir or working_dir == ".":
-            work_path = self.config.project_dir
+            lines = []
+            for phase_num in sorted(by_phase):
+                phase_info = phases.get(str(phase_num), {})
+                phase_name = phase_info.get("name", f"Phase {phase_num}")
+                lines.append(f"\n**{phase_name}**:")
+                for story in by_phase[phase_num]:
+                    # Use title as the main description
+                    lines.append(f"- {story['title']}")
+            return "\n".join(lines)
         else:
-            work_path = self.config.project_dir / working_dir
+            # No phases, just list stories
+            lines = []
+            for story in completed:
+                lines.append(f"- {story['title']}")
+            return "\n".join(lines)
+
+    def _generate_feature_summary(
+        self,
+        completed_stories: List[Dict],
+        remaining_stories: List[Dict],
+        prd: Dict,
+    ) -> Iterator[str]:
+        """Generate AI-powered feature summary of what was built and what's testable.
+
+        Yields the summary text in chunks as Claude produces it.
+        """
+        if not completed_stories:
+            return
 
-        if not work_path.exists():
-            return "No project directory found yet."
-        
-        # List key files and directories
-        summary_lines = []
         try:
-            # Get top-level items
-            items = sorted(work_path.iterdir())
-            dirs = [d.name for d in items if d.is_dir() and not d.name.startswith('.')]
-            files = [f.name for f in items if f.is_file() and not f.name.startswith('.')]
-            
-            if dirs:
-                summary_lines.append(f"**Directories**: {', '.join(dirs[:10])}")
-            if files:
-                summary_lines.append(f"**Key Files**: {', '.join(files[:15])}")
-            
-            # Check for common project files
-            common_files = ["pyproject.toml", "package.json", "requirements.txt", "README.md", "Makefile"]
-            found_files = [f for f in common_files if (work_path / f).exists()]
-            if found_files:
-                summary_lines.append(f"**Project Files**: {', '.join(found_files)}")
-            
-        except Exception as e:
-            summary_lines.append(f"Error reading directory: {e}")
-        
-        return "\n".join(summary_lines) if summary_lines else "Empty project directory."
-    
-    def _execute_story(self, story: Dict, prd: Dict, iteration: int) -> bool:
-        """Execute a single story using Claude Code."""
-        # Mark story as in_progress
-        story["status"] = "in_progress"
+            # Build context for Claude
+            completed_details = []
+            story_by_id = self._story_index(prd)
+            for story_info in completed_stories:
+                # Find full story details from PRD
+                full_story = story_by_id.get(story_info["id"])
+                if full_story:
+                    completed_details.append({
+                        "id": full_story["id"],
+                        "title": full_story["title"],
+                        "description": full_story.get("description", ""),
+                        "acceptanceCriteria": full_story.get("acceptanceCriteria", [])
+                    })
 
-        # Track execution time for this story
-        story_start_time = time.time()
+            # Build remaining stories context (limited)
+            remaining_details = []
+            for story in remaining_stories[:5]:  # Only first 5 for context
+                remaining_details.append({
+                    "id": story["id"],
+                    "title": story["title"]
+                })
 
-        # Build agent context
-        context = self._build_context(story, prd)
+            system_prompt = _project_system_prompt(
+                _SUMMARY_SYSTEM_PROMPT,
+                prd.get('project', 'Unknown'),
+                prd.get('description', ''),
+            )
+            prompt = f"""## Stories Completed This Session
+{json.dumps(completed_details, indent=2)}
 
-        # Build prompt
-        prompt = self._build_agent_prompt(story, context)
+## Remaining Stories (Next Up)
+{json.dumps(remaining_details, indent=2) if remaining_details else "All stories completed!"}
 
-        # Determine working directory for execution
-        working_dir = context.get('workingDirectory')
-        if working_dir and working_dir != ".":
-            work_path = self.config.project_dir / working_dir
-            work_path.mkdir(parents=True, exist_ok=True)
-        else:
-            work_path = self.config.project_dir
+Write the session summary."""
 
-        # Create detailed log file for this story
-        logs_dir = self.config.logs_dir
-        logs_dir.mkdir(exist_ok=True)
-        detail_log = logs_dir / f"story-{story['id']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log"
+            # Call Claude Code CLI (uses OAuth, no API key needed)
+            from ralph.prd import call_claude_code_stream
 
-        if HAS_RICH and console:
-            console.print(Panel(
-                f"[bold cyan]Story {story['id']}: {story['title']}[/bold cyan]\n"
-                f"[dim]Iteration {iteration}[/dim]\n"
-                f"[dim]Log file: {detail_log}[/dim]",
-                title="🤖 Claude Code Agent",
-                border_style="cyan"
-            ))
-        else:
-            print(f"🤖 Spawning Claude Code agent for story {story['id']}...")
-            print(f"   Log file: {detail_log}")
+            model = self.config.get("claude.model", "claude-opus-4-5")
+            yield from call_claude_code_stream(
+                prompt,
+                model=model,
+                timeout=120,
+                system_prompt=system_prompt,
+            )
 
-        try:
-            # Write prompt to log file
-            with open(detail_log, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write(f"Story: {story['id']} - {story['title']}\n")
-                f.write(f"Iteration: {iteration}\n")
-                f.write(f"Started: {datetime.now().isoformat()}\n")
-                f.write("=" * 80 + "\n\n")
-                f.write("PROMPT:\n")
-                f.write("-" * 80 + "\n")
-                f.write(prompt)
-                f.write("\n" + "-" * 80 + "\n\n")
-                f.write("CLAUDE CODE OUTPUT:\n")
-                f.write("-" * 80 + "\n")
+        except Exception as e:
+            # If AI summary fails, stop here (the mechanical summary follows)
+            print(f"\n   ⚠️  Could not generate feature summary: {e}")
 
-            # Determine if we should use streaming output
-            use_streaming = self.config.get("ralph.useStreaming", True)
-            
-            if use_streaming:
-                # Use claude-stream.py for real-time streaming output
-                script_path = Path(__file__).parent / "claude-stream.py"
-                cmd = [
-                    "python3",
-                    str(script_path),
-                    "--dangerously-skip-permissions",
-                    "--model", self.config.get("claude.model", "claude-opus-4-5"),
-                ]
-                # Add verbose flags if requested
-                if self.verbose:
-                    cmd.extend(["--verbose", "--show-prompt"])
-                cmd.extend(["-p", prompt])
-                
-                # Use Popen to stream output in real-time while also capturing it
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,  # Line buffered
-                    cwd=work_path
-                )
-                
-                # Stream output in real-time and capture it
-                agent_output_lines = []
-                timeout_seconds = self.config.get("ralph.iterationTimeout", 3600)
-                start_time = time.time()
+    def _print_session_summary(self, prd: Dict, iteration_count: int, _prd_path: Path) -> None:
+        """Print comprehensive session summary at the end of execution."""
+        session_duration = time.time() - self.session_start_time if self.session_start_time else 0
 
-                try:
-                    assert process.stdout is not None, "stdout should not be None"
-                    for line in process.stdout:
-                        print(line, end='', flush=True)  # Print immediately
-                        agent_output_lines.append(line)
-
-                        # Also write to detail log in real-time
-                        with open(detail_log, 'a') as f:
-                            f.write(line)
-                        
-                        # Check for timeout
-                        if time.time() - start_time > timeout_seconds:
-                            process.kill()
-                            agent_output = ''.join(agent_output_lines)
-                            raise subprocess.TimeoutExpired(cmd, timeout_seconds)
-                    
-                    process.wait()
-                    agent_output = ''.join(agent_output_lines)
-                    return_code = process.returncode
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    agent_output = ''.join(agent_output_lines)
-                    raise
-            else:
-                # Fallback to original non-streaming approach
+        # Get file changes from git
+        changed_files = []
+        if self._git_bin:
+            try:
                 result = subprocess.run(
-                    [
-                        "claude",
-                        "--dangerously-skip-permissions",
-                        "--model", self.config.get("claude.model", "claude-opus-4-5"),
-                        prompt  # Pass prompt as final argument
-                    ],
+                    [self._git_bin, "diff", "--name-only", "HEAD"],
                     capture_output=True,
                     text=True,
-                    cwd=work_path,
-                    timeout=self.config.get("ralph.iterationTimeout", 3600)
+                    timeout=10
                 )
-                agent_output = result.stdout
-                return_code = result.returncode
+                if result.returncode == 0:
+                    changed_files = [f for f in result.stdout.strip().split('\n') if f]
+            except Exception:
+                pass
 
-            # Write completion to log
-            with open(detail_log, 'a') as f:
-                f.write("\n" + "-" * 80 + "\n")
-                f.write(f"Completed: {datetime.now().isoformat()}\n")
-                f.write(f"Return code: {return_code}\n")
-                f.write("=" * 80 + "\n")
+        # Calculate stats
+        total_stories = len(prd["userStories"])
+        current_completed = sum(1 for s in prd["userStories"] if s.get("status") == "complete")
+        remaining_stories = total_stories - current_completed
+        session_completed_count = len(self.session_completed_stories)
 
-            if return_code != 0:
-                error_msg = f"Claude Code exited with error code {return_code}"
-                if HAS_RICH and console:
-                    console.print(Panel(
-                        f"[bold red]{error_msg}[/bold red]\n"
-                        f"[dim]Check log: {detail_log}[/dim]",
-                        title="❌ Error",
-                        border_style="red"
-                    ))
-                else:
-                    print(f"❌ {error_msg}")
-                    if not use_streaming:
-                        print(f"   Full output: {agent_output}")
+        remaining = [s for s in prd["userStories"] if s.get("status", "incomplete") not in _TERMINAL_STATUSES]
 
-                if not use_streaming:
-                    self._log_failure(story, agent_output + "\n\nSTDERR:\n" + result.stderr, None, iteration)
-                else:
-                    self._log_failure(story, agent_output, None, iteration)
-                return False
+        # Print summary
+        print("\n" + "="*80)
+        print("📊 SESSION SUMMARY")
+        print("="*80)
 
-            # Calculate total story execution time
-            total_story_duration = time.time() - story_start_time
+        # Session stats
+        hours = int(session_duration // 3600)
+        minutes = int((session_duration % 3600) // 60)
+        seconds = int(session_duration % 60)
+        duration_str = f"{hours}h {minutes}m {seconds}s" if hours > 0 else f"{minutes}m {seconds}s"
 
-            # Commit changes
-            self._commit_changes(story, prd)
+        print(f"\n⏱️  Duration: {duration_str}")
+        print(f"🔄 Iterations: {iteration_count}")
 
-            # Update progress log
-            self._update_progress_log(story, agent_output, iteration)
+        # Print AI-generated feature summary as it streams in, if we completed stories
+        if session_completed_count > 0:
+            started = False
+            for chunk in self._generate_feature_summary(
+                self.session_completed_stories,
+                remaining,
+                prd
+            ):
+                if not started:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    print("\n" + "-"*80)
+                    started = True
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+            if started:
+                print("\n" + "-"*80)
 
-            # Update agents.md if needed
-            if self.config.get("ralph.updateAgentsMd", True):
-                self._update_agents_md(story, agent_output)
+        # Stories completed this session (technical details)
+        if session_completed_count > 0:
+            print(f"\n✅ Completed This Session ({session_completed_count} stories):")
+            for story_info in self.session_completed_stories:
+                print(f"   • {story_info['id']}: {story_info['title']} ({story_info['duration']:.1f}s)")
+        else:
+            print(f"\n⚠️  No stories completed this session")
 
-            # Show success summary
-            if HAS_RICH and console:
-                console.print("\n")
-                console.print(Panel(
-                    f"[bold green]✓ Story {story['id']} completed successfully![/bold green]\n\n"
-                    f"[cyan]Title:[/cyan] {story['title']}\n"
-                    f"[cyan]Total time:[/cyan] {total_story_duration:.1f}s\n"
-                    f"[cyan]Log file:[/cyan] {detail_log}",
-                    title="🎉 Success",
-                    border_style="green"
-                ))
-            else:
-                print(f"\n✅ Story {story['id']} completed successfully!")
+        # Files changed
+        if changed_files:
+            print(f"\n📝 Files Changed ({len(changed_files)} files):")
+            # Group by directory and show top 10
+            display_files = changed_files[:10]
+            for f in display_files:
+                print(f"   • {f}")
+            if len(changed_files) > 10:
+                print(f"   ... and {len(changed_files) - 10} more")
 
-            return True
+        # Overall PRD status
+        print(f"\n📋 Overall Progress:")
+        print(f"   Total Stories: {total_stories}")
+        print(f"   Completed: {current_completed} ({100*current_completed//total_stories if total_stories > 0 else 0}%)")
+        print(f"   Remaining: {remaining_stories}")
 
-        except subprocess.TimeoutExpired:
-            print(f"⏱️ Claude Code timed out after {self.config.get('ralph.iterationTimeout', 3600)}s")
-            self._log_failure(story, "Claude Code execution timed out", None, iteration)
-            return False
-        except Exception as e:
-            print(f"❌ Error executing story: {e}")
-            self._log_failure(story, str(e), None, iteration)
-            return False
-    
-    def _build_context(self, story: Dict, prd: Dict) -> Dict:
-        """Build context for agent."""
-        # Load progress log (recent entries) from .ralph/progress.md
-        progress_file = self.config.progress_path
-        recent_progress = ""
-        if progress_file.exists():
-            with open(progress_file, 'r') as f:
-                lines = f.readlines()
-                # Get last 50 lines
-                recent_progress = "".join(lines[-50:])
+        if remaining_stories > 0:
+            print(f"\n📌 Next Stories to Complete:")
+            # Only the top 3 are shown, so avoid sorting the whole remaining list
+            for story in heapq.nsmallest(3, remaining, key=_next_story_key):
+                print(f"   • {story['id']}: {story['title']}")
+            if len(remaining) > 3:
+                print(f"   ... and {len(remaining) - 3} more")
 
-        # Find relevant agents.md files
-        agents_md = self._find_agents_md()
+        # Next steps
+        print(f"\n💡 Next Steps:")
+        if remaining_stories > 0:
+            print(f"   Run: python ralph.py execute-plan")
+            print(f"   Or: python ralph.py status")
+        else:
+            print(f"   All stories complete! Review and merge your changes.")
 
-        # Get working directory from config (defaults to current directory)
-        # Only use a subdirectory if explicitly configured via ralph.workingDirectory
-        working_dir = self.config.get("ralph.workingDirectory", ".")
+        print("\n" + "="*80 + "\n")
 
-        # Load guardrails (learned failures)
-        guardrails = self._load_guardrails()
+    def show_info(self, prd_path: Optional[Path] = None, phase: Optional[int] = None) -> None:
+        """Show startup banner and PRD info without executing anything."""
+        from ralph.utils import show_ralph_banner
 
-        # Get design doc reference
-        design_doc_path = self._get_design_doc(prd)
+        prd_path = prd_path or self.config.prd_path
+
+        # Load PRD
+        try:
+            prd = read_prd(prd_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"PRD file not found: {prd_path}") from None
 
-        # Build prose description of completed work
-        completed_prose = self._build_completed_stories_prose(prd)
+        max_iter = self.config.get("ralph.maxIterations", 20)
+        max_failures = self.config.get("ralph.maxFailures", 3)
 
-        # Count remaining stories
-        remaining_count = len([s for s in prd["userStories"] if s.get("status", "incomplete") not in ("complete", "skipped")])
+        # Display Ralph ASCII art
+        show_ralph_banner()
 
-        return {
-            "story": story,
-            "prd": {
-                "project": prd.get("project", ""),
-                "description": prd.get("description", ""),
-                "completedProse": completed_prose,
-                "remainingCount": remaining_count,
-                "designDocPath": design_doc_path
-            },
-            "progress": recent_progress,
-            "agentsMd": agents_md,
-            "guardrails": guardrails,
-            "projectConfig": {
-                "commands": self.config.get("commands", {})
-            },
-            "workingDirectory": working_dir
-        }
-    
-    def _build_agent_prompt(self, story: Dict, context: Dict) -> str:
-        """Build prompt for Claude agent."""
-        progress_section = f"\n## Recent Progress\n{context['progress']}" if context['progress'] else ""
-        agents_section = f"\n## Agents.md\n{context['agentsMd']}" if context['agentsMd'] else ""
+        # Display phase info if filtering by phase
+        phase_info = ""
+        if phase is not None:
+            phase_info = f"\n   🎯 Phase Filter: Phase {phase}"
 
-        # Add working directory instruction only if using a subdirectory (not "." or empty)
-        working_dir = context.get('workingDirectory')
-        working_dir_section = ""
-        if working_dir and working_dir != ".":
-            working_dir_section = f"""
-## Working Directory
+        print(f"\n🚀 Ralph - Autonomous AI Agent Loop")
+        print(f"   Project: {prd.get('project', 'Unknown')}")
+        print(f"   Branch: {prd.get('branchName', 'N/A')}")
+        print(f"   Max iterations: {max_iter if max_iter > 0 else 'unlimited'}")
+        print(f"   Max consecutive failures: {max_failures}")
 
-**IMPORTANT**: You are currently running in the `{working_dir}/` directory.
-- All file paths are relative to this directory
-- When you create files, they will be in `{working_dir}/`
-- The project code is separate from the Ralph automation codebase
-- Use relative paths (e.g., `memory/blocks.py`, not `{working_dir}/memory/blocks.py`)
-"""
+        # Count stories and roll up per-phase totals in a single pass
+        all_stories = prd.get('userStories', [])
+        total = len(all_stories)
+        completed = 0
+        stories_to_complete = []
+        phase_counts: Dict[int, Dict[str, int]] = defaultdict(lambda: {"total": 0, "completed": 0})
+        for s in all_stories:
+            status = s.get('status', 'incomplete')
+            if HAS_RICH:  # Phase summary is only displayed with rich
+                counts = phase_counts[s.get("phase", 0)]
+                counts["total"] += 1
+                if status == 'complete':
+                    counts["completed"] += 1
+            if status == 'complete':
+                completed += 1
+            elif status != 'skipped' and (phase is None or s.get('phase') == phase):
+                stories_to_complete.append(s)
 
-        # Build completed stories context with prose descriptions
-        completed_stories_context = ""
-        completed_prose = context['prd'].get('completedProse', '')
-        if completed_prose:
-            completed_stories_context = f"""
-## What's Already Built
+        print(f"   Progress: {completed}/{total} stories ({completed/total*100:.0f}%)")
+        print(f"   Stories to complete: {len(stories_to_complete)}{phase_info}")
 
-The following features have been implemented and their code is in the codebase:
-{completed_prose}
+        # Show phases summary (derived from stories)
+        if phase_counts:
+            print()
+            for phase_num in sorted(phase_counts.keys()):
+                if phase_num == 0:
+                    continue  # Skip unphased stories in summary
+                phase_completed = phase_counts[phase_num]["completed"]
+                phase_total = phase_counts[phase_num]["total"]
+                if phase_completed == phase_total:
+                    status = "✅"
+                elif phase_completed > 0:
+                    status = "🔄"
+                else:
+                    status = "⏳"
+                print(f"   {status} Phase {phase_num} ({phase_completed}/{phase_total})")
 
-**IMPORTANT**: Before implementing, read the existing code to understand:
-- What patterns are being used
-- What utilities/helpers already exist
-- How similar features are implemented
-- What dependencies are available
-"""
+        # Show next story
+        if stories_to_complete:
+            next_story = min(stories_to_complete, key=_next_story_key)
+            print(f"\n   ➡️  Next: {next_story['id']} - {next_story['title']}")
 
-        # Build guardrails section (learned failures)
-        guardrails_section = ""
-        guardrails = context.get('guardrails', '')
-        if guardrails:
-            guardrails_section = f"""
-## Guardrails (Learned from Past Failures)
+        print(f"\n   💡 To execute: python ralph.py execute-plan" + (f" --phase {phase}" if phase else ""))
+        print()
 
-**READ THIS CAREFULLY** - These are patterns that caused failures in previous iterations:
+    def execute(self, prd_path: Optional[Path] = None, max_iterations: Optional[int] = None, phase: Optional[int] = None) -> None:
+        """Execute Ralph loop until completion or max iterations.
 
-{guardrails}
+        Args:
+            prd_path: Path to prd.json file
+            max_iterations: Maximum number of iterations (0 = unlimited)
+            phase: Only execute stories in this phase (None = all incomplete stories)
+        """
+        from ralph.utils import show_ralph_banner
 
-Follow these rules to avoid repeating the same mistakes.
-"""
+        prd_path = prd_path or self.config.prd_path
 
-        # Build design document reference section
-        design_doc_section = ""
-        design_doc_path = context['prd'].get('designDocPath')
-        if design_doc_path:
-            design_doc_section = f"""
-## Design Document
+        # Load PRD
+        try:
+            prd = read_prd(prd_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"PRD file not found: {prd_path}") from None
+        self._refresh_story_index(prd)
 
-A design document is available at: `{design_doc_path}`
+        # Track session start
+        self.session_start_time = time.time()
 
-**IMPORTANT**: If you need to understand:
-- Overall architecture decisions
-- How components should interact
-- Design patterns to follow
-- Implementation guidelines
+        # Track initial state: completed count and stories to complete in one pass
+        completed_count = 0
+        stories_to_complete = []
+        for s in prd["userStories"]:
+            status = s.get("status", "incomplete")
+            if status == "complete":
+                completed_count += 1
+            elif status not in _TERMINAL_STATUSES and (phase is None or s.get("phase") == phase):
+                stories_to_complete.append(s)
+        self.initial_completed_count = completed_count
 
-Read the design document for detailed guidance.
-"""
+        max_iter = max_iterations or self.config.get("ralph.maxIterations", 20)
+        max_failures = self.config.get("ralph.maxFailures", 3)
 
-        # Remaining work context
-        remaining_context = ""
-        remaining_count = context['prd'].get('remainingCount', 0)
-        if remaining_count > 1:
-            remaining_context = f"\n**Remaining**: {remaining_count - 1} more stories after this one."
+        # Display Ralph ASCII art
+        show_ralph_banner()
 
-        return f"""You are an autonomous coding agent working on a software project.
+        # Display phase info if filtering by phase
+        phase_info = ""
+        if phase is not None:
+            phase_info = f"\n   🎯 Phase Filter: Phase {phase}"
 
-## Your Task
+        print(f"\n🚀 Starting Ralph Loop")
+        print(f"   Max iterations: {max_iter if max_iter > 0 else 'unlimited'}")
+        print(f"   Max consecutive failures: {max_failures}")
 
-Implement the following user story:
+        print(f"   Stories to complete: {len(stories_to_complete)}{phase_info}\n")
 
-**Story ID**: {story['id']}
-**Title**: {story['title']}
-**Description**: {story.get('description', '')}
+        # Settings read on every iteration
+        live_status_updates = self.config.get("ralph.liveStatusUpdates", True)
+        progress_file = self.config.progress_path
+        
+        iteration = 0
+        remaining_stories = self._remaining_stories(prd, phase)
+        # Selection for the next iteration, started during the pause between
+        # iterations so the (network-bound) Claude call overlaps the wait
+        next_story: Optional[_StoryPrefetch] = None
 
-**Acceptance Criteria**:
-{chr(10).join(f"- {c}" for c in story.get('acceptanceCriteria', []))}
+        try:
+            while True:
+                iteration += 1
 
-## Project Context
+                stop_reason = self._iteration_stop_conditions(
+                    iteration, max_iter, max_failures, remaining_stories, phase
+                )
+                if stop_reason:
+                    print(stop_reason)
+                    break
+
+                story = None
+                if next_story is not None:
+                    # Selection output is buffered in the worker and printed here,
+                    # so it never interleaves with the main thread's output
+                    story, selection_log = next_story.result()
+                    for line in selection_log:
+                        print(line)
+
+                self._run_one_iteration(
+                    prd, prd_path, iteration, remaining_stories,
+                    max_failures=max_failures,
+                    live_status_updates=live_status_updates,
+                    progress_file=progress_file,
+                    story=story,
+                )
 
-**Project**: {context['prd'].get('project', '')} - {context['prd'].get('description', 'Unknown')}{remaining_context}
-{design_doc_section}
-{guardrails_section}
-{completed_stories_context}
-{progress_section}
-{agents_section}
-{working_dir_section}
+                remaining_stories = self._remaining_stories(prd, phase)
+                next_story = None
+                if not self._iteration_stop_conditions(
+                    iteration + 1, max_iter, max_failures, remaining_stories, phase
+                ):
+                    next_story = _StoryPrefetch(
+                        partial(self._prefetch_next_story, remaining_stories, prd)
+                    )
+
+                # Brief pause between iterations
+                time.sleep(2)
+        finally:
+            # An in-flight selection is abandoned: its daemon thread is never
+            # joined, so an interrupt returns immediately
+            self._close_progress_fd()
 
-## Implementation Strategy
+        # Print session summary
+        self._print_session_summary(prd, iteration, prd_path)
+    
+    def _select_next_story(
+        self, stories: List[Dict], prd: Dict, log: Callable[[str], None] = print
+    ) -> Dict:
+        """Select next story using AI analysis or simple priority-based selection.
 
-Follow this incremental approach:
+        Args:
+            log: Receives each progress line (defaults to printing it)
+        """
+        # Check if AI-powered selection is enabled
+        use_ai_selection = self.config.get("ralph.useAISelection", True)
+        
+        if use_ai_selection:
+            try:
+                return self._select_next_story_with_claude(stories, prd, log)
+            except Exception as e:
+                log(f"   ⚠️  AI selection failed: {e}")
+                log("   Falling back to simple priority-based selection...")
+                # Fall through to simple selection
+        
+        # Simple priority-based selection (fallback)
+        return self._select_next_story_simple(stories, prd)
+    
+    def _prefetch_next_story(self, stories: List[Dict], prd: Dict) -> Tuple[Dict, List[str]]:
+        """Select the next story on a worker thread, buffering its progress lines."""
+        lines: List[str] = []
+        return self._select_next_story(stories, prd, lines.append), lines
 
-1. **Explore First** (5-10 minutes)
-   - Read existing codebase to understand structure and patterns
-   - Identify what utilities/helpers already exist
-   - Check what dependencies are available
-   - Understand how similar features are implemented
+    def _select_next_story_simple(self, stories: List[Dict], prd: Dict) -> Dict:
+        """Select next story based on priority and dependencies (simple heuristic)."""
+        # Sort by priority
+        stories.sort(key=lambda s: s.get("priority", 999))
+        
+        # Filter by dependencies (simple heuristic)
+        story_by_id = self._story_index(prd)
+        runnable = []
+        for story in stories:
+            # Check if story mentions other story IDs that aren't complete
+            mentioned_ids = {
+                story_id
+                for text in _iter_strings(story)
+                for story_id in _US_ID_RE.findall(text)
+            }
+            
+            dependencies_satisfied = True
+            for dep_id in mentioned_ids:
+                if dep_id != story["id"]:
+                    dep_story = story_by_id.get(dep_id)
+                    if dep_story and dep_story.get("status", "incomplete") not in _TERMINAL_STATUSES:
+                        dependencies_satisfied = False
+                        break
+            
+            if dependencies_satisfied:
+                runnable.append(story)
+        
+        return runnable[0] if runnable else stories[0]
+    
+    def _select_next_story_with_claude(
+        self, stories: List[Dict], prd: Dict, log: Callable[[str], None] = print
+    ) -> Dict:
+        """Use Claude to intelligently select the next story based on codebase analysis."""
+        from ralph.prd import call_claude_code
 
-2. **Plan Implementation** (2-3 minutes)
-   - Break down acceptance criteria into concrete tasks
-   - Identify which files need to be created/modified
-   - **Determine what tests are needed (BOTH unit tests with mocks AND E2E tests with real integrations!)**
-   - Plan E2E tests FIRST - they verify actual functionality
-   - Consider edge cases and error handling
+        log("🧠 Analyzing stories with Claude to select optimal next task...")
+        
+        # Build summary of remaining stories
+        remaining_stories_summary = []
+        for story in stories:
+            remaining_stories_summary.append({
+                "id": story["id"],
+                "title": story["title"],
+                "description": story.get("description", ""),
+                "priority": story.get("priority", 999),
+                "acceptanceCriteria": story.get("acceptanceCriteria", [])
+            })
+        
+        # Get completed stories
+        completed_stories = [s for s in prd["userStories"] if s.get("status") == "complete"]
+        completed_ids = [s["id"] for s in completed_stories]
+        
+        # Get codebase structure (list key files/directories)
+        codebase_summary = self._get_codebase_summary(prd)
+        
+        # Build prompt for Claude: stable instructions as the system prompt, this
+        # iteration's state as the user prompt
+        system_prompt = _project_system_prompt(
+            _SELECTION_SYSTEM_PROMPT,
+            prd.get('project', 'Unknown'),
+            prd.get('description', 'No description'),
+        )
+        prompt = f"""**Completed Stories**: {', '.join(completed_ids) if completed_ids else 'None'}
 
-3. **Implement Incrementally** (iterative)
-   - Start with core functionality first
-   - Build one acceptance criterion at a time
-   - Test each piece as you build it
-   - Follow existing code patterns and conventions
-   - Keep files modular and focused (see file size guidance below)
+## Current Codebase Structure
 
-4. **Verify Quality** (before finishing)
-   - Run all acceptance criteria against your implementation
-   - **Run E2E tests with real integrations (CRITICAL!) - this catches issues mocks miss**
-   - Ensure code is clean and maintainable
-   - Check that both E2E tests and unit tests exist and pass
-   - Verify type safety and error handling
-   - Check file sizes and refactor if needed (see file size guidance below)
+{codebase_summary}
 
-## Auto-Installation of Missing Dependencies
+## Remaining Stories
 
-**IMPORTANT**: If you encounter errors running commands due to missing tools or packages, you have permission to install them automatically.
+{json.dumps(remaining_stories_summary, indent=2)}
 
-### When to Auto-Install
+Select the next story to implement."""
 
-If a command fails with errors like:
-- "command not found"
-- "No such file or directory"
-- "package not found"
-- Missing executables or tools
+        # Call Claude Code CLI (uses OAuth, no API key needed)
+        model = self.config.get("claude.model", "claude-opus-4-5")
+
+        response_text = call_claude_code(prompt, model=model, timeout=120, system_prompt=system_prompt)
+        
+        # Typical responses are pure JSON - only regex-scan the reply if that fails
+        selection = None
+        try:
+            selection = json.loads(response_text)
+        except json.JSONDecodeError:
+            # Extract JSON from response (handle multi-line JSON)
+            json_match = _CLAUDE_SEL_RE.search(response_text)
+            if not json_match:
+                # Try simpler pattern
+                json_match = _CLAUDE_SEL_SIMPLE_RE.search(response_text)
+            if json_match:
+                try:
+                    selection = json.loads(json_match.group())
+                except json.JSONDecodeError as e:
+                    log(f"   ⚠️  Failed to parse Claude response: {e}")
+        if isinstance(selection, dict):
+            selected_id = selection.get("selectedStoryId")
+            reasoning = selection.get("reasoning", "No reasoning provided")
+            
+            if selected_id:
+                # Find the story in the PRD's index; it must still be one of the
+                # remaining (filtered) stories
+                selected_story = self._story_index(prd).get(selected_id)
+                if selected_story is not None and selected_id in {s["id"] for s in stories}:
+                    log(f"   ✅ Selected: {selected_id} - {selected_story['title']}")
+                    log(f"   💭 Reasoning: {reasoning}")
+                    return selected_story
+                else:
+                    log(f"   ⚠️  Selected story {selected_id} not found in remaining stories")
+        
+        # Fallback if parsing fails
+        log("   ⚠️  Could not parse Claude selection, falling back to simple selection")
+        return self._select_next_story_simple(stories, prd)
+    
+    def _get_codebase_summary(self, prd: Dict) -> str:
+        """Get a summary of the current codebase structure."""
+        # Get working directory from config (defaults to current directory)
+        working_dir = self.config.get("ralph.workingDirectory", ".")
 
-### How to Install
+        if not working_dir or working_dir == ".":
+            work_path = self.config.project_dir
+        else:
+            work_path = self.config.project_dir / working_dir
 
-**On macOS (detected by `uname -s` == "Darwin"):**
-- Use Homebrew: `brew install <package-name>`
-- For Python packages: `pip install <package>` or `uv pip install <package>`
-- For Node packages: `npm install -g <package>` or `npm install <package>`
-- For system tools: `brew install <tool>`
+        try:
+            mtime = work_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return "No project directory found yet."
 
-**On Linux (detected by `uname -s` == "Linux"):**
-- Use apt: `sudo apt-get update && sudo apt-get install -y <package>`
-- Use yum/dnf: `sudo yum install -y <package>` or `sudo dnf install -y <package>`
-- For Python packages: `pip install <package>` or `pip3 install <package>`
-- For Node packages: `npm install -g <package>` or `npm install <package>`
+        # Directory mtime changes whenever entries are added or removed
+        cache = self._codebase_cache
+        if cache["path"] == work_path and cache["mtime"] == mtime:
+            summary: str = cache["summary"]
+            return summary
+        
+        # List key files and directories
+        summary_lines = []
+        try:
+            # Get top-level items (scandir entries cache their type, so only symlinks need a stat)
+            dirs: List[str] = []
+            files: List[str] = []
+            with os.scandir(work_path) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+            dirs.sort()
+            files.sort()
+            
+            if dirs:
+                summary_lines.append(f"**Directories**: {', '.join(dirs[:10])}")
+            if files:
+                summary_lines.append(f"**Key Files**: {', '.join(files[:15])}")
+            
+            # Check for common project files
+            common_files = ["pyproject.toml", "package.json", "requirements.txt", "README.md", "Makefile"]
+            present = set(files)
+            found_files = [f for f in common_files if f in present]
+            if found_files:
+                summary_lines.append(f"**Project Files**: {', '.join(found_files)}")
+            
+        except Exception as e:
+            summary_lines.append(f"Error reading directory: {e}")
+            return "\n".join(summary_lines)
+        
+        summary = "\n".join(summary_lines) if summary_lines else "Empty project directory."
+        self._codebase_cache = {"path": work_path, "mtime": mtime, "summary": summary}
+        return summary
+    
+    @staticmethod
+    def _remaining_stories(prd: Dict, phase: Optional[int] = None) -> List[Dict]:
+        """Return stories that still need work, optionally limited to one phase."""
+        return [
+            s for s in prd["userStories"]
+            if s.get("status", "incomplete") not in _TERMINAL_STATUSES
+            and (phase is None or s.get("phase") == phase)
+        ]
+
+    def _iteration_stop_conditions(
+        self,
+        iteration: int,
+        max_iter: int,
+        max_failures: int,
+        remaining_stories: List[Dict],
+        phase: Optional[int],
+    ) -> Optional[str]:
+        """Return the message to stop the loop with, or None to keep going."""
+        # Check max iterations
+        if max_iter > 0 and iteration > max_iter:
+            return f"\n⚠️  Max iterations ({max_iter}) reached"
+
+        # Check for remaining stories (with optional phase filter)
+        if not remaining_stories:
+            if phase is not None:
+                return f"\n✅ All Phase {phase} stories completed!"
+            return "\n✅ All stories completed!"
 
-**General Guidelines:**
-- Check if tool exists first: `which <tool>` or `command -v <tool>`
-- Install missing dependencies before retrying the failed command
-- For Python projects, check if virtual environment needs activation
-- For Node projects, check if `node_modules` needs installation
-- You have permission to use `sudo` when needed for system packages
+        # Check failure threshold
+        if self.failure_count >= max_failures:
+            return f"\n❌ Stopping: {max_failures} consecutive failures"
 
-### Examples
+        return None
 
-```bash
-# If `jq` command not found:
-brew install jq  # macOS
-sudo apt-get install -y jq  # Linux
+    def _run_one_iteration(
+        self,
+        prd: Dict,
+        prd_path: Path,
+        iteration: int,
+        remaining_stories: List[Dict],
+        max_failures: int,
+        live_status_updates: bool,
+        progress_file: Path,
+        story: Optional[Dict] = None,
+    ) -> bool:
+        """Select, execute and record a single story.
 
-# If Python package missing:
-pip install missing-package
-# or
-uv pip install missing-package
+        Args:
+            story: Story already selected for this iteration (selected here if None)
 
-# If Node command not found:
-npm install -g typescript
+        Returns:
+            True if the story completed successfully
+        """
+        # Select next story
+        if story is None:
+            story = self._select_next_story(remaining_stories, prd)
 
-# If git command fails, check if git is installed:
-which git || brew install git  # macOS
-```
+        if HAS_RICH and console:
+            console.print("\n")
+            console.print(Panel(
+                _SELECTION_PANEL_TMPL.format(
+                    iteration=iteration,
+                    id=story['id'],
+                    title=story['title'],
+                    priority=story.get('priority', 'N/A'),
+                    remaining=len(remaining_stories),
+                ),
+                title="📋 Story Selection",
+                border_style="magenta"
+            ))
+        else:
+            print(f"\n{'='*60}")
+            print(f"  Iteration {iteration} - {story['id']}: {story['title']}")
+            print(f"{'='*60}")
 
-**Always retry the original command after installation to verify it works.**
+        iteration_start = time.time()
 
-## File Size and Modularity
+        # One wall-clock stamp per iteration, shared with the story log
+        iter_now = datetime.now()
+        iter_now_iso = iter_now.isoformat()
 
-**CRITICAL**: Keep code files small, focused, and maintainable.
+        # Mark story as in-progress and save PRD (so viewers can see it)
+        story["status"] = "in_progress"
+        story["startedAt"] = iter_now_iso
+        prd["metadata"]["lastUpdatedAt"] = iter_now_iso
+        if live_status_updates:
+            dump_prd(prd, prd_path)
 
-### File Size Limits
-- **Maximum file size**: 500 lines (including imports, docstrings, and whitespace)
-- **Target file size**: 200-300 lines for most files
-- **If a file exceeds 500 lines**: Refactor it immediately into smaller modules
+        # Execute story
+        success = self._execute_story(story, prd, iteration, started_at=iter_now)
+        
+        iteration_duration = time.time() - iteration_start
+        
+        if success:
+            self.failure_count = 0  # Reset failure count on success
+            story["status"] = "complete"
+            # Track completed story in this session
+            self.session_completed_stories.append({
+                "id": story["id"],
+                "title": story["title"],
+                "duration": iteration_duration
+            })
+            story["actualDuration"] = iteration_duration
+            story["iterationNumber"] = iteration
+            
+            # Update PRD metadata
+            prd["metadata"]["completedStories"] = sum(
+                1 for s in prd["userStories"] if s.get("status") == "complete"
+            )
+            prd["metadata"]["currentIteration"] = iteration
+            prd["metadata"]["lastUpdatedAt"] = datetime.now().isoformat()
+            
+            # Save PRD
+            dump_prd(prd, prd_path)
+            
+            print(f"✅ Story {story['id']} completed ({iteration_duration:.1f}s)")
+        else:
+            self.failure_count += 1
+            print(f"❌ Story {story['id']} failed ({iteration_duration:.1f}s)")
+            print(f"   Consecutive failures: {self.failure_count}/{max_failures}")
+
+            # Update guardrails after 2+ consecutive failures on same story
+            if self.failure_count >= 2 and self.last_story_id == story['id']:
+                # Get error summary from the progress file (last failure logged)
+                error_summary = ""
+                try:
+                    # Get last 20 lines for error context
+                    error_summary = _tail_lines(progress_file, 20).rstrip("\n")
+                except FileNotFoundError:
+                    pass
+                self._update_guardrails(story, error_summary, self.failure_count)
 
-### When to Split Files
+        return success
 
-Split a file when:
-- It exceeds 500 lines
-- It contains multiple unrelated responsibilities
-- It has more than 5-7 classes or 10-15 functions
-- It handles multiple distinct concerns
+    def _execute_story(self, story: Dict, prd: Dict, iteration: int, started_at: Optional[datetime] = None) -> bool:
+        """Execute a single story using Claude Code.
 
-### How to Refactor Large Files
+        Args:
+            story: Story to execute
+            prd: Full PRD
+            iteration: Current loop iteration
+            started_at: Iteration start time (defaults to now)
+        """
+        started_at = started_at or datetime.now()
 
-1. **Identify logical groupings**: Group related functions/classes together
-2. **Extract into separate modules**: Create new files for each logical grouping
-3. **Use clear naming**: Module names should clearly indicate their purpose
-4. **Update imports**: Ensure all imports are updated correctly
-5. **Maintain public API**: Use `__init__.py` to re-export if needed
+        # Mark story as in_progress
+        story["status"] = "in_progress"
 
-### Examples of Good File Organization
+        # Track execution time for this story
+        story_start_time = time.time()
 
-**Bad** (one large file):
-```
-slack_bot/client.py  (800 lines)
-- Socket mode connection
-- Event handlers
-- Message formatting
-- User management
-- Channel management
-- Error handling
-- Logging setup
-```
+        use_streaming = self.config.get("ralph.useStreaming", True)
+        claude_model = self.config.get("claude.model", "claude-opus-4-5")
+        iteration_timeout = self.config.get("ralph.iterationTimeout", 3600)
+        update_agents_md = self.config.get("ralph.updateAgentsMd", True)
+        project_dir = self.config.project_dir
 
-**Good** (split into focused modules):
-```
-slack_bot/
-├── client.py           (150 lines) - Main client and connection
-├── events.py           (200 lines) - Event handlers
-├── formatting.py       (120 lines) - Message formatting
-├── users.py            (180 lines) - User management
-├── channels.py         (150 lines) - Channel management
-└── errors.py           (100 lines) - Error handling
-```
+        # Build agent context
+        context = self._build_context(story, prd)
 
-### Proactive Refactoring
+        # Build prompt
+        prompt = self._build_agent_prompt(story, context)
 
-**Before creating new code:**
-- Check if existing files in the area are approaching 500 lines
-- If so, refactor them first before adding new functionality
-- This prevents files from growing too large
+        # Determine working directory for execution
+        working_dir = context.get('workingDirectory')
+        if working_dir and working_dir != ".":
+            work_path = project_dir / working_dir
+            work_path.mkdir(parents=True, exist_ok=True)
+        else:
+            work_path = project_dir
 
-**When adding to existing files:**
-- Check current file size first
-- If adding would exceed 500 lines, refactor before adding
-- Consider if the new code belongs in a separate module
+        # Create detailed log file for this story
+        logs_dir = self.config.logs_dir
+        logs_dir.mkdir(exist_ok=True)
+        detail_log = logs_dir / f"story-{story['id']}-{started_at.strftime('%Y%m%d-%H%M%S')}.log"
 
-### File Size Check
+        if HAS_RICH and console:
+            console.print(Panel(
+                _AGENT_PANEL_TMPL.format(
+                    id=story['id'], title=story['title'], iteration=iteration, log=detail_log
+                ),
+                title="🤖 Claude Code Agent",
+                border_style="cyan"
+            ))
+        else:
+            print(f"🤖 Spawning Claude Code agent for story {story['id']}...")
+            print(f"   Log file: {detail_log}")
 
-Before finishing your implementation:
-1. Check line count of all modified/created files: `wc -l <file>`
-2. If any file exceeds 500 lines, refactor it into smaller modules
-3. Ensure each module has a single, clear responsibility
-4. Update all imports and ensure tests still pass
+        # One handle for the whole story log: header, streamed output and footer.
+        # Opened inside the try so an unwritable log fails the story, not the loop.
+        log: Optional[BinaryIO] = None
+        try:
+            log = open(detail_log, "ab", buffering=1 << 16)
+            # Write prompt to log file
+            log.write((
+                f"{'=' * 80}\n"
+                f"Story: {story['id']} - {story['title']}\n"
+                f"Iteration: {iteration}\n"
+                f"Started: {started_at.isoformat()}\n"
+                f"{'=' * 80}\n\n"
+                f"PROMPT:\n"
+                f"{'-' * 80}\n"
+                f"{prompt}\n"
+                f"{'-' * 80}\n\n"
+                f"CLAUDE CODE OUTPUT:\n"
+                f"{'-' * 80}\n"
+            ).encode("utf-8"))
+            log.flush()
 
-## Quality Requirements & Testing
+            # Determine if we should use streaming output
+            if use_streaming:
+                # Use claude-stream.py for real-time streaming output
+                script_path = Path(__file__).parent / "claude-stream.py"
+                cmd = [
+                    "python3",
+                    str(script_path),
+                    "--dangerously-skip-permissions",
+                    "--model", claude_model,
+                ]
+                # Add verbose flags if requested
+                if self.verbose:
+                    cmd.extend(["--verbose", "--show-prompt"])
+                cmd.extend(["-p", prompt])
+            else:
+                # Fallback to plain claude: output goes to the log but isn't echoed live
+                cmd = [
+                    "claude",
+                    "--dangerously-skip-permissions",
+                    "--model", claude_model,
+                    prompt  # Pass prompt as final argument
+                ]
 
-**CRITICAL**: Ensure your implementation meets quality standards.
+            # Streaming mode shows stderr inline; otherwise it's kept apart for the failure log
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if use_streaming else subprocess.PIPE,
+                cwd=work_path
+            )
+            stderr_tail = bytearray()
+            stderr_reader: Optional[threading.Thread] = None
+            if process.stderr is not None:
+                stderr_reader = threading.Thread(
+                    target=_read_tail, args=(process.stderr, stderr_tail), daemon=True
+                )
+                stderr_reader.start()
 
-### Type Safety
-- Add type hints to all function signatures
-- Use strict typing (no `Any` unless absolutely necessary)
-- Ensure mypy/pyright passes with no errors
-- Import types from `typing` module as needed
+            # Stream output as it arrives, keeping only its head and tail in memory
+            try:
+                agent_output = self._stream_agent_output(
+                    process, cmd, log, iteration_timeout, echo=use_streaming
+                )
+                process.wait()
+                return_code = process.returncode
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                if stderr_reader is not None:
+                    stderr_reader.join(timeout=5)
+            stderr_output = stderr_tail.decode("utf-8", errors="replace")
 
-### Testing Strategy
+            # Write completion to log
+            finished_at = datetime.now().isoformat()
+            log.write((
+                f"\n{'-' * 80}\n"
+                f"Completed: {finished_at}\n"
+                f"Return code: {return_code}\n"
+                f"{'=' * 80}\n"
+            ).encode("utf-8"))
+            log.close()
 
-**CRITICAL**: You MUST implement BOTH unit tests AND end-to-end tests. E2E tests are the most important!
+            if return_code != 0:
+                error_msg = f"Claude Code exited with error code {return_code}"
+                if HAS_RICH and console:
+                    console.print(Panel(
+                        _FAILURE_PANEL_TMPL.format(error=error_msg, log=detail_log),
+                        title="❌ Error",
+                        border_style="red"
+                    ))
+                else:
+                    print(f"❌ {error_msg}")
+                    if not use_streaming:
+                        print(f"   Full output: {agent_output}")
 
-#### 1. End-to-End (E2E) Tests - **REQUIRED**
-- **Purpose**: Verify the ACTUAL functionality works with real integrations
-- **What to test**: Full user-facing workflows with real external systems
-- **Examples**:
-  - CLI that calls Anthropic API → Test with REAL API calls
-  - Database operations → Test with REAL database
-  - File I/O → Test with REAL file system
-  - Network requests → Test with REAL endpoints (or local test servers)
-- **How to mark**: Use `@pytest.mark.e2e` decorator
-- **API Keys**: Use `@pytest.mark.skipif(not os.getenv('API_KEY'))` to skip if missing
-- **Critical**: E2E tests catch issues that mocks miss (model names, API changes, auth issues)
+                if not use_streaming:
+                    self._log_failure(
+                        story, agent_output + "\n\nSTDERR:\n" + stderr_output, None, iteration,
+                        timestamp=finished_at,
+                    )
+                else:
+                    self._log_failure(story, agent_output, None, iteration, timestamp=finished_at)
+                return False
 
-#### 2. Unit Tests - Use Mocks
-- **Purpose**: Test individual functions and classes in isolation
-- **When to mock**: External APIs, databases, network calls (but only in unit tests!)
-- **Examples**: `@patch('anthropic.Anthropic')`, `@patch('requests.get')`
+            # Calculate total story execution time
+            total_story_duration = time.time() - story_start_time
 
-#### 3. Integration Tests
-- **Purpose**: Test how components work together (but may still use test doubles)
-- **Examples**: Multiple modules interacting, data flowing through system
+            # Commit changes
+            self._commit_changes(story, prd)
 
-#### 4. Edge Cases
-- **Purpose**: Test boundary conditions, empty inputs, error states
+            # Update progress log
+            self._update_progress_log(story, agent_output, iteration, timestamp=finished_at)
 
-**Test file naming**: `test_<module_name>.py` or `test_<feature>_e2e.py` for E2E tests
+            # Update agents.md if needed
+            if update_agents_md:
+                self._update_agents_md(story, agent_output)
 
-**Running tests**:
-```bash
-pytest tests/              # Run all tests
-pytest tests/ -m e2e       # Run only E2E tests
-pytest tests/ -m "not e2e" # Run only unit/integration tests
-```
+            # Show success summary
+            if HAS_RICH and console:
+                console.print("\n")
+                console.print(Panel(
+                    _SUCCESS_PANEL_TMPL.format(
+                        id=story['id'],
+                        title=story['title'],
+                        duration=total_story_duration,
+                        log=detail_log,
+                    ),
+                    title="🎉 Success",
+                    border_style="green"
+                ))
+            else:
+                print(f"\n✅ Story {story['id']} completed successfully!")
 
-### Code Quality
-- Follow existing code patterns and conventions
-- Keep functions small and focused (< 50 lines)
-- Use descriptive variable and function names
-- Add docstrings for public functions and classes
-- Handle errors gracefully with try/except where appropriate
-- No commented-out code or debug print statements
-- Clean up imports (no unused imports)
+            return True
 
-### Linting & Formatting
-- Code must pass linting (ruff, pylint, or project-specific linter)
-- Follow PEP 8 style guidelines
-- Use consistent formatting (spaces, line breaks, etc.)
-- Maximum line length: 100-120 characters
+        except subprocess.TimeoutExpired:
+            print(f"⏱️ Claude Code timed out after {iteration_timeout}s")
+            self._log_failure(story, "Claude Code execution timed out", None, iteration)
+            return False
+        except Exception as e:
+            print(f"❌ Error executing story: {e}")
+            self._log_failure(story, str(e), None, iteration)
+            return False
+        finally:
+            if log is not None:
+                log.close()
+    
+    def _stream_agent_output(
+        self,
+        process: subprocess.Popen,
+        cmd: List[str],
+        log: BinaryIO,
+        timeout_seconds: float,
+        echo: bool = True,
+    ) -> str:
+        """Copy a child's stdout to log (and echo it, if asked) as it arrives.
+
+        Reads the raw pipe in 64 KiB chunks as poll() reports data, rather than
+        line by line, and sleeps in poll() until output or the deadline. On Linux
+        the child's pidfd is watched too, so its exit wakes the loop even if a
+        grandchild still holds the pipe open. poll() (unlike select()) has no
+        FD_SETSIZE limit, so high descriptor numbers in a long session are fine.
+
+        The full output only goes to the log; the returned text is its first and
+        last _OUTPUT_KEEP_BYTES, so memory stays flat however much the agent prints.
+
+        Raises:
+            subprocess.TimeoutExpired: If the child is still running after timeout_seconds
+        """
+        assert process.stdout is not None, "stdout should not be None"
+        fd = process.stdout.fileno()
+        os.set_blocking(fd, False)
 
-### Self-Review Checklist
+        try:
+            pidfd: Optional[int] = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            # Not Linux >= 5.3 (or no pidfd support): wait on the pipe alone
+            pidfd = None
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        if pidfd is not None:
+            poller.register(pidfd, select.POLLIN)
+
+        head = bytearray()
+        tail = bytearray()
+        total = 0
+        # Chunks can split multi-byte characters, so decode incrementally for display
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        deadline = time.monotonic() + timeout_seconds
+
+        def drain() -> bool:
+            """Read what the pipe has; return False once it hits EOF."""
+            while True:
+                try:
+                    chunk = os.read(fd, 65536)
+                except BlockingIOError:
+                    return True
+                if not chunk:
+                    return False
+                log.write(chunk)
+                log.flush()
+                if echo:
+                    sys.stdout.write(decoder.decode(chunk))
+                    sys.stdout.flush()
+
+                nonlocal total
+                total += len(chunk)
+                room = _OUTPUT_KEEP_BYTES - len(head)
+                if room > 0:
+                    head.extend(chunk[:room])
+                    chunk = chunk[room:]
+                tail.extend(chunk)
+                del tail[:-_OUTPUT_KEEP_BYTES]
+
+        def captured() -> bytes:
+            """Head and tail of the output, marking any gap between them."""
+            if total > len(head) + len(tail):
+                return bytes(head + b"\n...\n" + tail)
+            return bytes(head + tail)
 
-Before finishing, verify:
-- [ ] All acceptance criteria are met
-- [ ] Type hints added to all functions
-- [ ] **END-TO-END TESTS written and passing** (with real integrations - CRITICAL!)
-- [ ] Unit tests written and passing (with mocks for external dependencies)
-- [ ] **All files are under 500 lines** (check with `wc -l`)
-- [ ] Large files refactored into smaller, focused modules
-- [ ] No obvious bugs or edge cases missed
-- [ ] Error handling is appropriate
-- [ ] Code follows existing patterns
-- [ ] No debug code or print statements left in
-- [ ] Documentation/comments added where needed
+        try:
+            while True:
+                remaining_timeout = deadline - time.monotonic()
+                if remaining_timeout <= 0:
+                    process.kill()
+                    raise subprocess.TimeoutExpired(cmd, timeout_seconds, output=captured())
+
+                # Output, EOF and (with a pidfd) child exit all wake poll, so
+                # it can sleep until the deadline
+                ready = {
+                    ready_fd
+                    for ready_fd, _ in poller.poll(math.ceil(remaining_timeout * 1000))
+                }
+                if not ready:
+                    continue
+
+                if not drain():
+                    break
+                if pidfd is not None and pidfd in ready:
+                    # Child exited: collect anything written just before exit
+                    drain()
+                    break
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+
+        if echo:
+            sys.stdout.write(decoder.decode(b"", final=True))
+            sys.stdout.flush()
+        return captured().decode("utf-8", errors="replace")
 
-**CRITICAL REMINDER**: If your feature calls external APIs, databases, or services, you MUST have E2E tests that verify it works with the REAL system. Mocked unit tests alone are NOT sufficient!
+    def _build_context(self, story: Dict, prd: Dict) -> Dict:
+        """Build context for agent."""
+        progress_file = self.config.progress_path
+        # Get working directory from config (defaults to current directory)
+        # Only use a subdirectory if explicitly configured via ralph.workingDirectory
+        working_dir = self.config.get("ralph.workingDirectory", ".")
+        commands = self.config.get("commands", {})
 
-## Output Format
+        # Load progress log (recent entries) from .ralph/progress.md
+        recent_progress = self._read_cached(progress_file, _tail_lines) or ""
 
-After implementing, provide a summary with:
+        # Find relevant agents.md files
+        agents_md = self._find_agents_md()
 
-**✅ Implemented:**
-- List of acceptance criteria met
-- Key files created/modified
-- File sizes (line counts) for all new/modified code files
+        # Load guardrails (learned failures)
+        guardrails = self._load_guardrails()
 
-**🧪 Tests:**
-- **E2E tests**: List E2E test files and what they verify (REQUIRED if feature has external integrations)
-- **Unit tests**: List unit test files and coverage
-- Test coverage areas
-- How to run the tests (including how to run E2E tests with API keys)
+        # Get design doc reference
+        design_doc_path = self._get_design_doc(prd)
 
-**🔧 Refactoring:**
-- Any files that were split/refactored due to size
-- Any proactive refactoring done to keep files under 500 lines
+        # Build prose description of completed work
+        completed_prose = self._build_completed_stories_prose(prd)
 
-**📝 Notes:**
-- Any important patterns or decisions made
-- Dependencies added
-- Known limitations or future improvements needed
+        # Count remaining stories
+        remaining_count = len([s for s in prd["userStories"] if s.get("status", "incomplete") not in _TERMINAL_STATUSES])
 
-## Continuous Improvement: Skills & Documentation
+        return {
+            "story": story,
+            "prd": {
+                "project": prd.get("project", ""),
+                "description": prd.get("description", ""),
+                "completedProse": completed_prose,
+                "remainingCount": remaining_count,
+                "designDocPath": design_doc_path
+            },
+            "progress": recent_progress,
+            "agentsMd": agents_md,
+            "guardrails": guardrails,
+            "projectConfig": {
+                "commands": commands
+            },
+            "workingDirectory": working_dir
+        }
+    
+    def _build_agent_prompt(self, story: Dict, context: Dict) -> str:
+        """Build prompt for Claude agent."""
+        progress_section = f"\n## Recent Progress\n{context['progress']}" if context['progress'] else ""
+        agents_section = f"\n## Agents.md\n{context['agentsMd']}" if context['agentsMd'] else ""
 
-As you work, you should continuously improve the codebase's tooling and documentation.
+        # Add working directory instruction only if using a subdirectory (not "." or empty)
+        working_dir = context.get('workingDirectory')
+        working_dir_section = ""
+        if working_dir and working_dir != ".":
+            working_dir_section = f"""
+## Working Directory
 
-### Creating Claude Code Skills
+**IMPORTANT**: You are currently running in the `{working_dir}/` directory.
+- All file paths are relative to this directory
+- When you create files, they will be in `{working_dir}/`
+- The project code is separate from the Ralph automation codebase
+- Use relative paths (e.g., `memory/blocks.py`, not `{working_dir}/memory/blocks.py`)
+"""
 
-**IMPORTANT**: Create skills in `.claude/skills/` for reusable operations you discover or implement.
+        # Build completed stories context with prose descriptions
+        completed_stories_context = ""
+        completed_prose = context['prd'].get('completedProse', '')
+        if completed_prose:
+            completed_stories_context = f"""
+## What's Already Built
 
-Skills make future work faster and more reliable. Create a skill when you:
-- Run the same sequence of commands repeatedly (build, test, deploy)
-- Discover project-specific patterns or workflows
-- Implement something that would help future agents
+The following features have been implemented and their code is in the codebase:
+{completed_prose}
 
-**Skill structure** (create in `.claude/skills/<skill-name>/SKILL.md`):
-```yaml
----
-name: skill-name-kebab-case
-description: Brief description of when to use this skill (triggers automatic loading)
----
+**IMPORTANT**: Before implementing, read the existing code to understand:
+- What patterns are being used
+- What utilities/helpers already exist
+- How similar features are implemented
+- What dependencies are available
+"""
 
-# Skill Name
+        # Build guardrails section (learned failures)
+        guardrails_section = ""
+        guardrails = context.get('guardrails', '')
+        if guardrails:
+            guardrails_section = f"""
+## Guardrails (Learned from Past Failures)
 
-## Quick Start
-[Most common usage pattern]
+**READ THIS CAREFULLY** - These are patterns that caused failures in previous iterations:
 
-## Commands
-[Key commands with explanations]
+{guardrails}
 
-## Examples
-[Concrete examples]
+Follow these rules to avoid repeating the same mistakes.
+"""
 
-## Common Issues
-[Troubleshooting tips]
-```
+        # Build design document reference section
+        design_doc_section = ""
+        design_doc_path = context['prd'].get('designDocPath')
+        if design_doc_path:
+            design_doc_section = f"""
+## Design Document
 
-**Skills to consider creating:**
-- `build` - How to build the project
-- `test` - How to run tests (unit, E2E, specific modules)
-- `lint` - How to lint and auto-fix
-- `deploy` - Deployment steps if applicable
-- `db-migrate` - Database migration commands
-- Project-specific workflows
+A design document is available at: `{design_doc_path}`
 
-**Example skill** (`.claude/skills/test/SKILL.md`):
-```yaml
----
-name: test
-description: Run tests for this project. Use when asked to test, verify, or check code works.
----
+**IMPORTANT**: If you need to understand:
+- Overall architecture decisions
+- How components should interact
+- Design patterns to follow
+- Implementation guidelines
 
-# Testing
+Read the design document for detailed guidance.
+"""
 
-## Quick Start
-```bash
-pytest tests/           # All tests
-pytest tests/ -m e2e    # E2E tests only (requires API keys)
-```
+        # Remaining work context
+        remaining_context = ""
+        remaining_count = context['prd'].get('remainingCount', 0)
+        if remaining_count > 1:
+            remaining_context = f"\n**Remaining**: {remaining_count - 1} more stories after this one."
 
-## Test Categories
-- Unit tests: `pytest tests/ -m "not e2e"`
-- E2E tests: `ANTHROPIC_API_KEY=xxx pytest -m e2e`
+        header = f"""You are an autonomous coding agent working on a software project.
 
-## Coverage
-```bash
-pytest --cov=src --cov-report=html
-```
-```
+## Your Task
 
-### Updating AGENTS.md
+Implement the following user story:
 
-**IMPORTANT**: If you discover important codebase patterns, conventions, or knowledge that would help future agents, update `AGENTS.md`.
+**Story ID**: {story['id']}
+**Title**: {story['title']}
+**Description**: {story.get('description', '')}
 
-Add to AGENTS.md when you discover:
-- Project structure patterns
-- Naming conventions
-- Architecture decisions
-- Common gotchas or pitfalls
-- Key dependencies and how they're used
-- Testing patterns specific to this project
+**Acceptance Criteria**:
+{chr(10).join(f"- {c}" for c in story.get('acceptanceCriteria', []))}
 
-This helps future agents (and humans) work more effectively in this codebase.
+## Project Context
 
-Begin implementation now."""
+**Project**: {context['prd'].get('project', '')} - {context['prd'].get('description', 'Unknown')}{remaining_context}"""
+
+        # Empty sections still contribute their line break, as in the original
+        # single template, so the prompt text is unchanged
+        return "\n".join((
+            header,
+            design_doc_section,
+            guardrails_section,
+            completed_stories_context,
+            progress_section,
+            agents_section,
+            working_dir_section,
+            _AGENT_PROMPT_TAIL,
+        ))
     
     def _find_agents_md(self) -> str:
         """Find and load relevant agents.md files."""
@@ -1388,93 +1868,94 @@ Begin implementation now."""
         # Look for agents.md in current directory and parents
         current = Path.cwd()
         for _ in range(3):  # Check up to 3 levels up
-            agents_path = current / "AGENTS.md"
-            if agents_path.exists():
-                with open(agents_path, 'r') as f:
-                    agents_files.append(f"## {current.name}\n{f.read()}")
+            content = self._read_cached(current / "AGENTS.md")
+            if content is not None:
+                agents_files.append(f"## {current.name}\n{content}")
             current = current.parent
         
         return "\n\n".join(agents_files)
     
     def _commit_changes(self, story: Dict, prd: Optional[Dict] = None) -> None:
         """Commit changes to git in the working directory."""
-        try:
-            # Get working directory from config (defaults to current directory)
-            working_dir = self.config.get("ralph.workingDirectory", ".")
+        # Get working directory and commit format from config
+        working_dir = self.config.get("ralph.workingDirectory", ".")
+        commit_fmt = self.config.get("git.commitMessageFormat", "feat: {story_id} - {story_title}")
+        project_dir = self.config.project_dir
+
+        if not self._git_bin:
+            print("   ⚠️  Git not found, skipping commit")
+            return
 
+        try:
             if not working_dir or working_dir == ".":
-                work_path = self.config.project_dir
+                work_path = project_dir
             else:
-                work_path = self.config.project_dir / working_dir
+                work_path = project_dir / working_dir
 
             if not work_path.exists():
                 print(f"   ⚠️  Working directory {working_dir} doesn't exist")
                 return
 
-            # Check if there are changes
+            # Check for changes in the working directory; -b adds a "## <branch>..."
+            # header, saving a rev-parse
             result = subprocess.run(
-                ["git", "status", "--porcelain"],
+                [self._git_bin, "status", "--porcelain", "-b", "--", "."],
                 capture_output=True,
                 text=True,
                 cwd=work_path
             )
+            status_lines = result.stdout.splitlines()
+            current_branch = _branch_from_status_header(status_lines[0]) if status_lines else ""
 
-            if not result.stdout.strip():
+            if not any(line.strip() for line in status_lines[1:]):
                 print("   No changes to commit")
                 return
 
             # Get or create branch from PRD
             branch_name = prd.get("branchName", "main") if prd else "main"
 
-            # Check current branch
-            current_branch_result = subprocess.run(
-                ["git", "rev-parse", "--abbrev-ref", "HEAD"],
-                capture_output=True,
-                text=True,
-                cwd=work_path
-            )
-            current_branch = current_branch_result.stdout.strip()
-
             # Create and checkout branch if needed
             if current_branch != branch_name:
                 print(f"   📌 Creating/switching to branch: {branch_name}")
-                # Try to create branch (will fail if exists, that's ok)
-                subprocess.run(
-                    ["git", "checkout", "-b", branch_name],
-                    capture_output=True,
-                    cwd=work_path
-                )
-                # If that failed, try to checkout existing branch
-                subprocess.run(
-                    ["git", "checkout", branch_name],
+                # Switch to the existing branch, creating it only if that fails.
+                # git switch only takes branch names, so a branch named like a
+                # file can never be read as a pathspec and discard its changes.
+                switched = subprocess.run(
+                    [self._git_bin, "switch", branch_name],
                     capture_output=True,
                     cwd=work_path
                 )
+                if switched.returncode != 0:
+                    subprocess.run(
+                        [self._git_bin, "switch", "-c", branch_name],
+                        capture_output=True,
+                        cwd=work_path
+                    )
 
             # Commit
-            commit_msg = self.config.get("git.commitMessageFormat", "feat: {story_id} - {story_title}").format(
+            commit_msg = commit_fmt.format(
                 story_id=story["id"],
                 story_title=story["title"]
             )
 
+            # Mark new files intent-to-add (index entries only, no hashing) so
+            # the pathspec commit picks them up; "-- ." limits the commit to
+            # the working directory, as the old "git add ." did
             subprocess.run(
-                ["git", "add", "."],
+                [self._git_bin, "add", "-N", "--", "."],
                 check=True,
                 cwd=work_path
             )
 
             subprocess.run(
-                ["git", "commit", "-m", commit_msg],
+                [self._git_bin, "commit", "-m", commit_msg, "--", "."],
                 check=True,
                 cwd=work_path
             )
 
             if HAS_RICH and console:
                 console.print(Panel(
-                    f"[bold green]✓ Changes committed[/bold green]\n\n"
-                    f"[cyan]Branch:[/cyan] {branch_name}\n"
-                    f"[cyan]Message:[/cyan] {commit_msg}\n"
-                    f"[dim]Working directory: {work_path}[/dim]",
+                    _COMMIT_PANEL_TMPL.format(branch=branch_name, message=commit_msg, cwd=work_path),
                     title="📦 Git Commit",
                     border_style="green"
                 ))
@@ -1487,35 +1968,103 @@ Begin implementation now."""
         except FileNotFoundError:
             print("   ⚠️  Git not found, skipping commit")
     
-    def _update_progress_log(self, story: Dict, agent_output: str, iteration: int) -> None:
-        """Update .ralph/progress.md with iteration results."""
-        progress_file = self.config.progress_path
+    def _update_progress_log(
+        self, story: Dict, agent_output: str, iteration: int, timestamp: Optional[str] = None
+    ) -> None:
+        """Update .ralph/progress.md with iteration results.
 
-        # Initialize if needed
-        if not progress_file.exists():
-            with open(progress_file, 'w') as f:
-                f.write(f"# Ralph Progress Log\n")
-                f.write(f"Started: {datetime.now().isoformat()}\n")
-                f.write(f"---\n\n")
-
-        # Append iteration log
-        with open(progress_file, 'a') as f:
-            f.write(f"\n## Iteration {iteration} - {story['id']} - {datetime.now().isoformat()}\n")
-            f.write(f"**Story**: {story['title']}\n")
-            f.write(f"**Status**: ✅ PASSED\n")
-            f.write(f"\n**Agent Output**:\n```\n{agent_output[:500]}...\n```\n")
-            f.write(f"\n---\n")
+        Args:
+            story: Completed story
+            agent_output: Output from the agent run
+            iteration: Current loop iteration
+            timestamp: ISO timestamp for the entry (defaults to now)
+        """
+        timestamp = timestamp or datetime.now().isoformat()
+
+        # Header (if the log is new) and entry go out in a single write
+        entry = (
+            f"\n## Iteration {iteration} - {story['id']} - {timestamp}\n"
+            f"**Story**: {story['title']}\n"
+            f"**Status**: ✅ PASSED\n"
+            f"\n**Agent Output**:\n```\n{agent_output[:500]}...\n```\n"
+            f"\n---\n"
+        )
+        self._append_progress(entry, header=f"# Ralph Progress Log\nStarted: {timestamp}\n---\n\n")
     
-    def _log_failure(self, story: Dict, agent_output: str, _unused: Optional[Dict], iteration: int) -> None:
-        """Log failure to .ralph/progress.md."""
-        progress_file = self.config.progress_path
+    def _log_failure(
+        self,
+        story: Dict,
+        agent_output: str,
+        _unused: Optional[Dict],
+        iteration: int,
+        timestamp: Optional[str] = None,
+    ) -> None:
+        """Log failure to .ralph/progress.md.
+
+        Args:
+            story: Failed story
+            agent_output: Output from the agent run
+            _unused: Unused (kept for call compatibility)
+            iteration: Current loop iteration
+            timestamp: ISO timestamp for the entry (defaults to now)
+        """
+        timestamp = timestamp or datetime.now().isoformat()
+
+        # The cause of a failure is usually at the end, so keep both ends
+        if len(agent_output) > 1000:
+            excerpt = f"{agent_output[:500]}\n...\n{agent_output[-500:]}"
+        else:
+            excerpt = agent_output
 
-        with open(progress_file, 'a') as f:
-            f.write(f"\n## Iteration {iteration} - {story['id']} - {datetime.now().isoformat()}\n")
-            f.write(f"**Story**: {story['title']}\n")
-            f.write(f"**Status**: ❌ FAILED\n")
-            f.write(f"\n**Agent Output**:\n```\n{agent_output[:500]}...\n```\n")
-            f.write(f"\n---\n")
+        entry = (
+            f"\n## Iteration {iteration} - {story['id']} - {timestamp}\n"
+            f"**Story**: {story['title']}\n"
+            f"**Status**: ❌ FAILED\n"
+            f"\n**Agent Output**:\n```\n{excerpt}\n```\n"
+            f"\n---\n"
+        )
+        self._append_progress(entry)
+
+    def _append_progress(self, entry: str, header: str = "") -> None:
+        """Append an entry to the progress log with a single write.
+
+        Args:
+            entry: Markdown to append
+            header: Written before the entry if the log is empty
+        """
+        fd = self._get_progress_fd()
+        if header and os.fstat(fd).st_size == 0:
+            entry = header + entry
+        # O_APPEND makes each write land at the current end of file, even if the
+        # agent appended to the log in between
+        os.write(fd, entry.encode("utf-8"))
+
+    def _get_progress_fd(self) -> int:
+        """Return an O_APPEND descriptor for the progress log.
+
+        The descriptor is kept across iterations and reopened only if the file was
+        deleted or replaced since it was opened.
+        """
+        progress_file = self.config.progress_path
+        fd = self._progress_fd
+        if fd is not None:
+            try:
+                st = progress_file.stat()
+                fst = os.fstat(fd)
+                if (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino):
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_CLOEXEC", 0)
+        self._progress_fd = os.open(progress_file, flags, 0o644)
+        return self._progress_fd
+
+    def _close_progress_fd(self) -> None:
+        """Close the progress log descriptor if one is open."""
+        if self._progress_fd is not None:
+            os.close(self._progress_fd)
+            self._progress_fd = None
     
     def _update_agents_md(self, _story: Dict, _agent_output: str) -> None:
         """Update agents.md files with learnings."""
@@ -3,13 +3,26 @@
 import json
 import re
 import subprocess
+import tempfile
+import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
+from ralph.utils import dump_prd
 
-def call_claude_code(prompt: str, model: str = "claude-opus-4-5", timeout: int = 300) -> str:
+# Outermost {...} span in a model response that may wrap JSON in prose
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+def call_claude_code(
+    prompt: str,
+    model: str = "claude-opus-4-5",
+    timeout: int = 300,
+    system_prompt: Optional[str] = None,
+) -> str:
     """Call Claude Code CLI and return the response text.
 
     Uses Claude Code's existing OAuth authentication - no API key required.
@@ -18,6 +31,9 @@ def call_claude_code(prompt: str, model: str = "claude-opus-4-5", timeout: int =
         prompt: The prompt to send to Claude
         model: The Claude model to use
         timeout: Timeout in seconds
+        system_prompt: Stable instructions appended to the system prompt. Keeping
+            them identical across calls lets the prompt cache reuse the prefix so
+            only the per-call prompt is processed fresh.
 
     Returns:
         The response text from Claude
@@ -26,14 +42,18 @@ def call_claude_code(prompt: str, model: str = "claude-opus-4-5", timeout: int =
         RuntimeError: If Claude Code CLI is not found or fails
         FileNotFoundError: If Claude Code CLI is not installed
     """
+    cmd = [
+        "claude",
+        "--print",  # Output response only, no interactive mode
+        "--model", model,
+    ]
+    if system_prompt:
+        cmd.extend(["--append-system-prompt", system_prompt])
+    cmd.extend(["-p", prompt])
+
     try:
         result = subprocess.run(
-            [
-                "claude",
-                "--print",  # Output response only, no interactive mode
-                "--model", model,
-                "-p", prompt
-            ],
+            cmd,
             capture_output=True,
             text=True,
             timeout=timeout
@@ -53,6 +73,121 @@ def call_claude_code(prompt: str, model: str = "claude-opus-4-5", timeout: int =
         raise RuntimeError(f"Claude Code timed out after {timeout} seconds")
 
 
+def call_claude_code_stream(
+    prompt: str,
+    model: str = "claude-opus-4-5",
+    timeout: int = 300,
+    system_prompt: Optional[str] = None,
+) -> Iterator[str]:
+    """Call Claude Code CLI and yield the response text as it is generated.
+
+    Same contract as call_claude_code, but reads the CLI's stream-json output
+    with partial messages so callers can show text before the reply is done.
+    If the CLI emits no text deltas, the final result's text is yielded whole.
+    If the streaming call fails before any text arrives (e.g. a CLI that
+    doesn't support --include-partial-messages), the reply is fetched with
+    call_claude_code within the time left and yielded whole.
+
+    Args:
+        prompt: The prompt to send to Claude
+        model: The Claude model to use
+        timeout: Timeout in seconds for the whole response
+        system_prompt: Stable instructions appended to the system prompt
+
+    Yields:
+        Chunks of response text, in order
+
+    Raises:
+        RuntimeError: If Claude Code CLI is not found, fails, reports an
+            error result or times out
+    """
+    cmd = [
+        "claude",
+        "--print",
+        "--model", model,
+        "--output-format", "stream-json",
+        "--include-partial-messages",
+        "--verbose",  # Required by the CLI for stream-json with --print
+    ]
+    if system_prompt:
+        cmd.extend(["--append-system-prompt", system_prompt])
+    cmd.extend(["-p", prompt])
+
+    # stderr goes to a temp file so a chatty CLI can't block on a full pipe
+    # while stdout is being read
+    with tempfile.TemporaryFile(mode="w+") as stderr_file:
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                text=True,
+            )
+        except FileNotFoundError:
+            raise RuntimeError(
+                "Claude Code CLI not found. Please install it:\n"
+                "  npm install -g @anthropic-ai/claude-code\n"
+                "Or see: https://claude.ai/code"
+            )
+
+        # Reading stdout blocks, so the timeout is enforced by killing the process
+        timed_out = threading.Event()
+
+        def _kill_on_timeout() -> None:
+            timed_out.set()
+            process.kill()
+
+        start = time.monotonic()
+        timer = threading.Timer(timeout, _kill_on_timeout)
+        timer.start()
+        streamed = False
+        result_text = ""
+        try:
+            assert process.stdout is not None
+            for line in process.stdout:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if event.get("type") == "stream_event":
+                    delta = event.get("event", {}).get("delta", {})
+                    if delta.get("type") == "text_delta" and delta.get("text"):
+                        streamed = True
+                        yield delta["text"]
+                elif event.get("type") == "result":
+                    if event.get("is_error"):
+                        raise RuntimeError(
+                            f"Claude Code reported an error: {event.get('result', '')}"
+                        )
+                    result_text = event.get("result") or ""
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if timed_out.is_set():
+            raise RuntimeError(f"Claude Code timed out after {timeout} seconds")
+        if returncode != 0:
+            if not streamed:
+                # Retry within what's left of the overall timeout
+                remaining = int(timeout - (time.monotonic() - start))
+                if remaining <= 0:
+                    raise RuntimeError(f"Claude Code timed out after {timeout} seconds")
+                yield call_claude_code(
+                    prompt, model=model, timeout=remaining, system_prompt=system_prompt
+                )
+                return
+            stderr_file.seek(0)
+            raise RuntimeError(
+                f"Claude Code failed with return code {returncode}: {stderr_file.read()}"
+            )
+        if not streamed and result_text:
+            # No partial messages were emitted; the reply only came in the result
+            yield result_text
+
+
 @dataclass
 class ValidationIssue:
     """A validation issue (error or warning)."""
@@ -424,7 +559,7 @@ class PRDParser:
 
         # Call Claude Code CLI (uses OAuth, no API key needed)
         response_text = call_claude_code(prompt, model=self.model, timeout=300)
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        json_match = _JSON_OBJECT_RE.search(response_text)
 
         if json_match:
             prd_json = json.loads(json_match.group())
@@ -440,8 +575,7 @@ class PRDParser:
 
         # Save to file
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w') as f:
-            json.dump(prd_json, f, indent=2)
+        dump_prd(prd_json, output_path)
 
         print(f"✅ PRD converted to: {output_path}")
         print(f"   Found {len(prd_json.get('userStories', []))} user stories")
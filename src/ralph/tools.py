@@ -1,10 +1,11 @@
 """PRD management tools for manipulating prd.json files."""
 
-import json
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from ralph.utils import dump_prd, read_prd
+
 
 def resolve_prd_path(project_dir: Optional[Path] = None) -> Path:
     """Resolve PRD path from project directory.
@@ -48,14 +49,12 @@ class PRDManager:
 
     def _load(self) -> Dict[str, Any]:
         """Load PRD JSON file."""
-        with open(self.prd_path) as f:
-            return json.load(f)  # type: ignore[no-any-return]
+        return read_prd(self.prd_path)
 
     def save(self) -> None:
         """Save PRD JSON file."""
         self.data["metadata"]["lastUpdatedAt"] = datetime.now().isoformat()
-        with open(self.prd_path, "w") as f:
-            json.dump(self.data, f, indent=2)
+        dump_prd(self.data, self.prd_path)
 
     def update_story_phase(self, story_id: str, new_phase: int) -> bool:
         """Update a story's phase number.
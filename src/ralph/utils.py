@@ -1,24 +1,65 @@
 """Utility functions."""
 
 import json
+import os
+import stat
 from pathlib import Path
 from typing import Any, Optional
 
-# Try to import ASCII art display (optional dependency)
+# Use orjson for PRD (de)serialization when available (optional dependency)
 try:
-    from ascii_image import display_ascii_image  # type: ignore[import-not-found]
+    import orjson
 
-    HAS_ASCII_ART = True
+    HAS_ORJSON = True
 except ImportError:
-    HAS_ASCII_ART = False
+    HAS_ORJSON = False
+
+
+def read_prd(path: Path) -> dict[str, Any]:
+    """Read and parse a PRD JSON file.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file isn't valid JSON
+    """
+    if HAS_ORJSON:
+        data: dict[str, Any] = orjson.loads(path.read_bytes())
+        return data
+    with open(path, encoding="utf-8") as f:
+        loaded: dict[str, Any] = json.load(f)
+        return loaded
+
+
+def dump_prd(prd: dict[str, Any], path: Path) -> None:
+    """Write a PRD to a JSON file with 2-space indentation.
+
+    The JSON is written to a temporary file and renamed over the target, so a
+    crash mid-write never leaves a truncated PRD and viewers never read one.
+    An existing file's permissions are carried over to the new one.
+    """
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    try:
+        if HAS_ORJSON:
+            tmp_path.write_bytes(
+                orjson.dumps(prd, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            )
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(prd, f, indent=2, ensure_ascii=False)
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(path.stat().st_mode))
+        except FileNotFoundError:
+            pass  # New PRD: keep the default mode
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def load_prd(path: Path) -> Optional[dict[str, Any]]:
     """Load PRD from JSON file."""
     try:
-        with open(path) as f:
-            data: dict[str, Any] = json.load(f)
-            return data
+        return read_prd(path)
     except FileNotFoundError:
         return None
     except json.JSONDecodeError:
@@ -31,18 +72,23 @@ def show_ralph_banner() -> bool:
     Returns:
         True if ASCII art was displayed, False otherwise
     """
-    if HAS_ASCII_ART:
-        ralph_image_path = Path(__file__).parent.parent.parent / "ralph.jpg"
-        if ralph_image_path.exists():
-            try:
-                display_ascii_image(
-                    str(ralph_image_path),
-                    max_width=60,
-                    dark_mode=True,
-                    contrast_factor=1.5,
-                )
-                print()  # Add spacing after ASCII art
-                return True
-            except Exception:
-                pass
+    # Optional dependency, imported only when a banner is shown
+    try:
+        from ascii_image import display_ascii_image  # type: ignore[import-not-found]
+    except ImportError:
+        return False
+
+    ralph_image_path = Path(__file__).parent.parent.parent / "ralph.jpg"
+    if ralph_image_path.exists():
+        try:
+            display_ascii_image(
+                str(ralph_image_path),
+                max_width=60,
+                dark_mode=True,
+                contrast_factor=1.5,
+            )
+            print()  # Add spacing after ASCII art
+            return True
+        except Exception:
+            pass
     return False
@@ -13,6 +13,7 @@ from ralph.builder import (
     _ensure_valid_structure,
     _estimate_tokens,
     _parse_json_response,
+    _split_into_chunks,
 )
 
 
@@ -25,6 +26,14 @@ class TestHelperFunctions:
         text = "a" * 100
         assert _estimate_tokens(text) == 25
 
+    def test_split_into_chunks(self) -> None:
+        """Test that chunks break on blank lines and preserve the text."""
+        text = "\n\n".join(["a" * 40, "b" * 40, "c" * 40])
+        with patch('ralph.builder.MAX_TOKENS_PER_BATCH', 20):
+            chunks = _split_into_chunks(text)
+        assert chunks == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
+        assert "\n\n".join(chunks) == text
+
     def test_parse_json_response_direct(self) -> None:
         """Test parsing valid JSON directly."""
         response = '{"project": "Test", "userStories": []}'
@@ -43,6 +52,12 @@ class TestHelperFunctions:
         result = _parse_json_response(response)
         assert result["project"] == "Test"
 
+    def test_parse_json_response_braces_in_strings(self) -> None:
+        """Test that braces inside strings don't end the object early."""
+        response = 'Result: {"project": "a } b", "notes": "{"} Done.'
+        result = _parse_json_response(response)
+        assert result == {"project": "a } b", "notes": "{"}
+
     def test_parse_json_response_no_json(self) -> None:
         """Test parsing response with no JSON."""
         with pytest.raises(ValueError, match="No JSON object found"):
@@ -386,3 +401,46 @@ Story 2: Enhancement work
             assert "phases" in prd_json
             assert "2" in prd_json["phases"]
             assert prd_json["phases"]["2"]["name"] == "Phase 2"
+
+    @patch('ralph.builder.call_claude_code')
+    def test_build_batched_renumbers_duplicate_ids(self, mock_claude: MagicMock) -> None:
+        """Test that stories merged from later chunks get unique IDs and priorities."""
+        mock_claude.side_effect = [
+            json.dumps({
+                "project": "Test",
+                "phases": {"1": {"name": "Phase 1"}},
+                "userStories": [{"id": "US-001", "title": "First"}],
+            }),
+            json.dumps({
+                "phases": {"2": {"name": "Phase 2"}},
+                "userStories": [
+                    {"id": "US-001", "title": "Second"},
+                    {"id": "US-001", "title": "Third"},
+                ],
+            }),
+        ]
+
+        with patch('ralph.builder.MAX_TOKENS_PER_BATCH', 10):
+            prd_json = PRDBuilder()._build_batched("a" * 40 + "\n\n" + "b" * 40, "model")
+
+        stories = prd_json["userStories"]
+        assert [s["id"] for s in stories] == ["US-001", "US-002", "US-003"]
+        assert [s["priority"] for s in stories[1:]] == [2, 3]
+        assert set(prd_json["phases"]) == {"1", "2"}
+
+    @patch('ralph.builder.call_claude_code')
+    def test_build_batched_story_without_id(self, mock_claude: MagicMock) -> None:
+        """Test that a merged story with no ID passes through instead of raising."""
+        mock_claude.side_effect = [
+            json.dumps({"userStories": [{"id": "US-001", "title": "First"}]}),
+            json.dumps({"userStories": [{"title": "Second"}, {"id": "US-001", "title": "Third"}]}),
+        ]
+
+        with patch('ralph.builder.MAX_TOKENS_PER_BATCH', 10):
+            prd_json = PRDBuilder()._build_batched("a" * 40 + "\n\n" + "b" * 40, "model")
+
+        stories = prd_json["userStories"]
+        assert [s["title"] for s in stories] == ["First", "Second", "Third"]
+        assert "id" not in stories[1]
+        assert stories[2]["id"] == "US-003"
+        assert [s["priority"] for s in stories[1:]] == [2, 3]
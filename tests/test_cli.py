@@ -483,3 +483,62 @@ def test_cli_validate_strict_flag() -> None:
     )
     assert result.returncode == 0
     assert "--strict" in result.stdout
+
+
+def test_build_parser_is_cached() -> None:
+    """Test that the argument parser is built once and reused across calls."""
+    from ralph.cli import _build_parser
+
+    assert _build_parser() is _build_parser()
+    args = _build_parser().parse_args(["status", "--phase", "2"])
+    assert args.command == "status"
+    assert args.phase == 2
+
+
+def test_build_parser_only_adds_selected_command_args() -> None:
+    """Test that the parser is built with arguments for the invoked subcommand."""
+    from ralph.cli import _build_parser, _find_command
+
+    assert _find_command(["-C", "proj", "run", "--phase", "1"]) == "run"
+    assert _find_command(["--dir=proj", "status"]) == "status"
+    assert _find_command(["--version"]) == ""
+
+    args = _build_parser("run").parse_args(["run", "--phase", "1", "--verbose"])
+    assert args.command == "run"
+    assert args.phase == 1
+    assert args.verbose is True
+
+
+def test_build_parser_rejects_abbreviated_global_options() -> None:
+    """Test that global options can't be abbreviated past _find_command's scan."""
+    from ralph.cli import _build_parser, _find_command
+
+    argv = ["--dir", "proj", "status", "--phase", "2"]
+    args = _build_parser(_find_command(argv)).parse_args(argv)
+    assert args.command == "status"
+    assert args.dir == Path("proj")
+    assert args.phase == 2
+
+    # "--di" would otherwise expand to --dir while the scan took "proj" as the
+    # command, leaving status's own arguments unregistered
+    for argv in (["--di", "proj", "status"], ["--di", "proj", "status", "--phase", "2"]):
+        with pytest.raises(SystemExit):
+            _build_parser(_find_command(argv)).parse_args(argv)
+
+
+def test_every_subcommand_has_a_handler() -> None:
+    """Test that every subcommand and alias dispatches to an existing handler."""
+    import importlib
+
+    from ralph.cli import _SUBCOMMANDS, _command_handler
+
+    for name, _help, aliases, _add_args in _SUBCOMMANDS:
+        for command in (name, *aliases):
+            target = _command_handler(command)
+            assert target is not None, command
+            mod_name, fn_name = target
+            assert callable(getattr(importlib.import_module(mod_name), fn_name))
+
+    assert _command_handler("run") == _command_handler("execute")
+    assert _command_handler("nope") is None
+    assert _command_handler(None) is None
@@ -0,0 +1,324 @@
+"""Tests for the Ralph execution loop."""
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import pytest
+
+from ralph.config import RalphConfig
+from ralph.loop import _OUTPUT_KEEP_BYTES, RalphLoop, _read_tail, _tail_lines
+from ralph.utils import dump_prd
+
+
+@pytest.fixture
+def sample_prd() -> Dict[str, Any]:
+    """PRD with two incomplete stories."""
+    return {
+        "project": "Test Project",
+        "description": "Test",
+        "userStories": [
+            {"id": "US-001", "title": "Story 1", "priority": 1, "status": "incomplete"},
+            {"id": "US-002", "title": "Story 2", "priority": 2, "status": "incomplete"},
+        ],
+    }
+
+
+@pytest.fixture
+def loop(tmp_path: Path) -> RalphLoop:
+    """RalphLoop for a project in tmp_path."""
+    return RalphLoop(RalphConfig(project_dir=tmp_path))
+
+
+def test_execute_interrupt_does_not_wait_for_prefetch(
+    loop: RalphLoop, sample_prd: Dict[str, Any]
+) -> None:
+    """Test that an interrupt during the pause abandons the in-flight selection."""
+    dump_prd(sample_prd, loop.config.prd_path)
+    started = threading.Event()
+    release = threading.Event()
+    selecting: List[threading.Thread] = []
+
+    def slow_select(stories: List[Dict], prd: Dict) -> Any:
+        selecting.append(threading.current_thread())
+        started.set()
+        release.wait(30)
+        return stories[0], []
+
+    def interrupted_sleep(seconds: float) -> None:
+        raise KeyboardInterrupt
+
+    with patch.object(loop, "_run_one_iteration"), \
+            patch.object(loop, "_prefetch_next_story", side_effect=slow_select), \
+            patch("ralph.loop.time.sleep", side_effect=interrupted_sleep), \
+            patch("ralph.utils.show_ralph_banner"):
+        start = time.monotonic()
+        with pytest.raises(KeyboardInterrupt):
+            loop.execute(max_iterations=5)
+        elapsed = time.monotonic() - start
+
+    try:
+        assert elapsed < 5
+        assert started.wait(5)
+        # The worker is a daemon, so interpreter exit does not join it either
+        assert all(t.daemon for t in selecting)
+        assert loop._progress_fd is None
+    finally:
+        release.set()
+
+
+def test_select_simple_uses_prd_argument(loop: RalphLoop) -> None:
+    """Test that dependencies are checked against the PRD passed in, without execute()."""
+    prd = {
+        "userStories": [
+            {"id": "US-001", "title": "Base", "priority": 2, "status": "incomplete"},
+            {"id": "US-002", "title": "Needs US-001", "priority": 1, "status": "incomplete"},
+        ]
+    }
+    assert loop._select_next_story_simple(list(prd["userStories"]), prd)["id"] == "US-001"
+
+    # A different PRD (e.g. reloaded from disk) is re-indexed
+    reloaded = {
+        "userStories": [
+            {"id": "US-001", "title": "Base", "priority": 2, "status": "complete"},
+            {"id": "US-002", "title": "Needs US-001", "priority": 1, "status": "incomplete"},
+        ]
+    }
+    remaining = [reloaded["userStories"][1]]
+    assert loop._select_next_story_simple(remaining, reloaded)["id"] == "US-002"
+
+
+def test_select_with_claude_rejects_story_not_remaining(
+    loop: RalphLoop, sample_prd: Dict[str, Any]
+) -> None:
+    """Test that Claude's choice must be one of the remaining stories."""
+    remaining = [sample_prd["userStories"][1]]
+    reply = '{"selectedStoryId": "US-001", "reasoning": "r"}'
+    with patch("ralph.prd.call_claude_code", return_value=reply), \
+            patch.object(loop, "_get_codebase_summary", return_value=""):
+        story = loop._select_next_story_with_claude(remaining, sample_prd, lambda line: None)
+    assert story["id"] == "US-002"
+
+    reply = '{"selectedStoryId": "US-002", "reasoning": "r"}'
+    with patch("ralph.prd.call_claude_code", return_value=reply), \
+            patch.object(loop, "_get_codebase_summary", return_value=""):
+        story = loop._select_next_story_with_claude(remaining, sample_prd, lambda line: None)
+    assert story is sample_prd["userStories"][1]
+
+
+def _fake_agent(code: str) -> "subprocess.Popen[bytes]":
+    """Start a Python child standing in for the agent CLI."""
+    return subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+
+
+def test_stream_agent_output_keeps_head_and_tail(loop: RalphLoop) -> None:
+    """Test that large output is logged in full but only its ends are returned."""
+    size = _OUTPUT_KEEP_BYTES * 4
+    process = _fake_agent(
+        "import sys; sys.stdout.write('H' * 10 + 'm' * %d + 'T' * 10)" % size
+    )
+    log = io.BytesIO()
+
+    output = loop._stream_agent_output(process, ["agent"], log, timeout_seconds=30, echo=False)
+    process.wait()
+
+    assert len(log.getvalue()) == size + 20
+    assert output.startswith("H" * 10)
+    assert output.endswith("T" * 10)
+    assert "\n...\n" in output
+    assert len(output) == 2 * _OUTPUT_KEEP_BYTES + len("\n...\n")
+
+
+def test_stream_agent_output_small_output_returned_whole(loop: RalphLoop) -> None:
+    """Test that output within the kept window is returned unchanged."""
+    process = _fake_agent("print('hello')")
+
+    output = loop._stream_agent_output(
+        process, ["agent"], io.BytesIO(), timeout_seconds=30, echo=False
+    )
+
+    assert output == "hello\n"
+    assert process.wait() == 0
+
+
+def test_stream_agent_output_timeout_kills_child(loop: RalphLoop) -> None:
+    """Test that a child still running at the deadline is killed."""
+    process = _fake_agent("import sys, time; print('started'); sys.stdout.flush(); time.sleep(30)")
+    start = time.monotonic()
+
+    with pytest.raises(subprocess.TimeoutExpired) as excinfo:
+        loop._stream_agent_output(process, ["agent"], io.BytesIO(), timeout_seconds=1, echo=False)
+
+    assert process.wait(timeout=5) != 0
+    assert time.monotonic() - start < 10
+    assert excinfo.value.output == b"started\n"
+
+
+def test_stream_agent_output_returns_on_early_exit(loop: RalphLoop) -> None:
+    """Test that the child's exit ends the wait even if a grandchild holds the pipe."""
+    if not hasattr(os, "pidfd_open"):
+        pytest.skip("needs pidfd support")
+    process = _fake_agent(
+        "import subprocess, sys; print('bye'); sys.stdout.flush();"
+        "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(15)'])"
+    )
+    start = time.monotonic()
+
+    output = loop._stream_agent_output(
+        process, ["agent"], io.BytesIO(), timeout_seconds=20, echo=False
+    )
+
+    assert time.monotonic() - start < 10
+    assert output == "bye\n"
+    assert process.wait() == 0
+
+
+def test_read_tail_keeps_last_bytes() -> None:
+    """Test that only the last `limit` bytes of a stream are kept."""
+    tail = bytearray()
+    _read_tail(io.BufferedReader(io.BytesIO(b"a" * 100 + b"end")), tail, limit=10)
+    assert tail == b"a" * 7 + b"end"
+
+
+def test_execute_story_failure_logs_stderr_tail(
+    loop: RalphLoop, sample_prd: Dict[str, Any]
+) -> None:
+    """Test that a failed non-streaming agent's stderr tail reaches the failure log."""
+    settings = {"ralph.useStreaming": False, "ralph.updateAgentsMd": False}
+    real_popen = subprocess.Popen
+    code = (
+        "import sys; print('working'); sys.stdout.flush();"
+        "sys.stderr.write('e' * %d + 'boom'); sys.exit(3)" % (_OUTPUT_KEEP_BYTES * 2)
+    )
+
+    def fake_popen(cmd: List[str], **kwargs: Any) -> "subprocess.Popen[bytes]":
+        return real_popen([sys.executable, "-c", code], **kwargs)
+
+    story = sample_prd["userStories"][0]
+    with patch.object(loop.config, "get", side_effect=lambda k, d=None: settings.get(k, d)), \
+            patch("ralph.loop.subprocess.Popen", side_effect=fake_popen), \
+            patch.object(loop, "_log_failure") as log_failure:
+        assert loop._execute_story(story, sample_prd, iteration=1) is False
+
+    failure_text = log_failure.call_args[0][1]
+    assert failure_text.startswith("working\n")
+    stderr_text = failure_text.split("STDERR:\n", 1)[1]
+    assert stderr_text.endswith("boom")
+    assert len(stderr_text) == _OUTPUT_KEEP_BYTES
+
+
+def _expected_tail(text: str, n: int) -> str:
+    """Last n lines of text, read the straightforward way."""
+    return "".join(text.splitlines(keepends=True)[-n:])
+
+
+@pytest.mark.parametrize(
+    "text, n",
+    [
+        ("one\ntwo\nthree\n", 2),  # shorter than the window, trailing newline
+        ("one\ntwo\nthree", 2),  # no trailing newline
+        ("one\ntwo\n", 10),  # n larger than the number of lines
+        ("", 5),
+        ("x" * 20000 + "\n" + "y" * 30000 + "\nlast\n", 2),  # lines longer than 8 KiB
+        ("".join(f"line {i}\n" for i in range(5000)), 50),  # window has to grow
+    ],
+    ids=["short", "no-trailing-newline", "n-exceeds-lines", "empty", "long-lines", "many-lines"],
+)
+def test_tail_lines(tmp_path: Path, text: str, n: int) -> None:
+    """Test that _tail_lines matches reading the whole file."""
+    path = tmp_path / "progress.md"
+    path.write_text(text)
+    assert _tail_lines(path, n) == _expected_tail(text, n)
+
+
+def _git(cwd: Path, *args: str) -> str:
+    """Run git in cwd and return its stdout."""
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_commit_changes_limited_to_working_dir(loop: RalphLoop, tmp_path: Path) -> None:
+    """Test that new files in the working dir are committed on the existing PRD branch."""
+    _git(tmp_path, "init", "-q", "-b", "main")
+    _git(tmp_path, "config", "user.email", "ralph@example.com")
+    _git(tmp_path, "config", "user.name", "Ralph")
+    app = tmp_path / "app"
+    app.mkdir()
+    (app / "existing.py").write_text("x = 1\n")
+    _git(tmp_path, "add", "app")
+    _git(tmp_path, "commit", "-q", "-m", "initial")
+    # The PRD branch already exists with work of its own
+    _git(tmp_path, "switch", "-q", "-c", "ralph/feature")
+    (app / "earlier.py").write_text("y = 2\n")
+    _git(tmp_path, "add", "app")
+    _git(tmp_path, "commit", "-q", "-m", "earlier story")
+    earlier = _git(tmp_path, "rev-parse", "HEAD").strip()
+    _git(tmp_path, "switch", "-q", "main")
+
+    # Files the agent created, inside and outside the working directory
+    (app / "new.py").write_text("z = 3\n")
+    (tmp_path / "outside.txt").write_text("not ours\n")
+
+    settings = {"ralph.workingDirectory": "app"}
+    story = {"id": "US-001", "title": "Add new"}
+    with patch.object(loop.config, "get", side_effect=lambda k, d=None: settings.get(k, d)):
+        loop._commit_changes(story, {"branchName": "ralph/feature"})
+
+    assert _git(tmp_path, "branch", "--show-current").strip() == "ralph/feature"
+    assert _git(tmp_path, "rev-parse", "HEAD~1").strip() == earlier
+    committed = _git(tmp_path, "show", "--name-only", "--format=%s", "HEAD").split()
+    assert "app/new.py" in committed
+    assert "outside.txt" not in committed
+    assert "?? outside.txt" in _git(tmp_path, "status", "--porcelain")
+
+
+def test_progress_fd_append_close_reopen(loop: RalphLoop) -> None:
+    """Test that progress entries survive closing and reopening the descriptor."""
+    progress = loop.config.progress_path
+
+    loop._append_progress("first\n", header="# Progress\n")
+    fd = loop._progress_fd
+    assert fd is not None
+    loop._append_progress("second\n", header="# Progress\n")
+    assert loop._progress_fd == fd  # kept across writes
+
+    loop._close_progress_fd()
+    assert loop._progress_fd is None
+    loop._close_progress_fd()  # closing twice is harmless
+
+    loop._append_progress("third\n", header="# Progress\n")
+    assert progress.read_text() == "# Progress\nfirst\nsecond\nthird\n"
+
+    # A replaced log is reopened rather than written through the stale descriptor
+    progress.unlink()
+    loop._append_progress("fresh\n", header="# Progress\n")
+    assert progress.read_text() == "# Progress\nfresh\n"
+    loop._close_progress_fd()
+
+
+def test_execute_closes_progress_fd_on_error(
+    loop: RalphLoop, sample_prd: Dict[str, Any]
+) -> None:
+    """Test that execute() closes the progress log when an iteration raises."""
+    dump_prd(sample_prd, loop.config.prd_path)
+
+    def failing_iteration(*args: Any, **kwargs: Any) -> bool:
+        loop._append_progress("entry\n")
+        raise RuntimeError("boom")
+
+    with patch.object(loop, "_run_one_iteration", side_effect=failing_iteration), \
+            patch("ralph.utils.show_ralph_banner"):
+        with pytest.raises(RuntimeError, match="boom"):
+            loop.execute(max_iterations=1)
+
+    assert loop._progress_fd is None
+    assert loop.config.progress_path.read_text() == "entry\n"
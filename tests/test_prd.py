@@ -14,6 +14,7 @@ from ralph.prd import (
     ValidationIssue,
     ValidationResult,
     call_claude_code,
+    call_claude_code_stream,
     validate_prd,
 )
 
@@ -443,6 +444,116 @@ class TestCallClaudeCode:
             call_claude_code("Test prompt", timeout=300)
 
 
+class TestCallClaudeCodeStream:
+    """Tests for call_claude_code_stream function."""
+
+    @staticmethod
+    def _process(lines: list, returncode: int = 0) -> MagicMock:
+        process = MagicMock()
+        process.stdout = iter(lines)
+        process.wait.return_value = returncode
+        process.poll.return_value = returncode
+        return process
+
+    @staticmethod
+    def _delta(text: str) -> str:
+        return json.dumps({
+            "type": "stream_event",
+            "event": {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}},
+        }) + "\n"
+
+    @patch('ralph.prd.subprocess.Popen')
+    def test_yields_text_deltas(self, mock_popen: MagicMock) -> None:
+        """Test that partial-message text deltas are yielded in order."""
+        mock_popen.return_value = self._process([
+            '{"type": "system"}\n',
+            self._delta("Hello"),
+            self._delta(" world"),
+            '{"type": "result", "result": "Hello world"}\n',
+        ])
+
+        assert list(call_claude_code_stream("Test prompt")) == ["Hello", " world"]
+        cmd = mock_popen.call_args[0][0]
+        assert "--include-partial-messages" in cmd
+
+    @patch('ralph.prd.call_claude_code')
+    @patch('ralph.prd.subprocess.Popen')
+    def test_falls_back_to_call_claude_code(
+        self, mock_popen: MagicMock, mock_call: MagicMock
+    ) -> None:
+        """Test that a failure before any text retries without streaming."""
+        mock_popen.return_value = self._process([], returncode=1)
+        mock_call.return_value = "Done"
+
+        assert list(call_claude_code_stream("Test prompt")) == ["Done"]
+        mock_call.assert_called_once()
+
+    @patch('ralph.prd.subprocess.Popen')
+    def test_yields_result_without_deltas(self, mock_popen: MagicMock) -> None:
+        """Test that the result text is yielded when no text deltas are streamed."""
+        mock_popen.return_value = self._process([
+            '{"type": "system"}\n',
+            '{"type": "result", "result": "Whole reply"}\n',
+        ])
+
+        assert list(call_claude_code_stream("Test prompt")) == ["Whole reply"]
+
+    @patch('ralph.prd.time.monotonic')
+    @patch('ralph.prd.call_claude_code')
+    @patch('ralph.prd.subprocess.Popen')
+    def test_fallback_gets_remaining_time(
+        self, mock_popen: MagicMock, mock_call: MagicMock, mock_monotonic: MagicMock
+    ) -> None:
+        """Test that the non-streaming retry only gets the time left of the timeout."""
+        mock_popen.return_value = self._process([], returncode=1)
+        mock_call.return_value = "Done"
+        mock_monotonic.side_effect = [100.0, 170.0]
+
+        assert list(call_claude_code_stream("Test prompt", timeout=120)) == ["Done"]
+        assert mock_call.call_args.kwargs["timeout"] == 50
+
+    @patch('ralph.prd.time.monotonic')
+    @patch('ralph.prd.call_claude_code')
+    @patch('ralph.prd.subprocess.Popen')
+    def test_no_fallback_when_time_is_up(
+        self, mock_popen: MagicMock, mock_call: MagicMock, mock_monotonic: MagicMock
+    ) -> None:
+        """Test that no retry is made once the timeout is used up."""
+        mock_popen.return_value = self._process([], returncode=1)
+        mock_monotonic.side_effect = [100.0, 220.0]
+
+        with pytest.raises(RuntimeError, match="timed out"):
+            list(call_claude_code_stream("Test prompt", timeout=120))
+        mock_call.assert_not_called()
+
+    @patch('ralph.prd.subprocess.Popen')
+    def test_failure_after_text(self, mock_popen: MagicMock) -> None:
+        """Test that a non-zero exit after streaming text raises RuntimeError."""
+        mock_popen.return_value = self._process([self._delta("Partial")], returncode=1)
+
+        with pytest.raises(RuntimeError, match="Claude Code failed"):
+            list(call_claude_code_stream("Test prompt"))
+
+    @patch('ralph.prd.subprocess.Popen')
+    def test_error_result_raises(self, mock_popen: MagicMock) -> None:
+        """Test that an is_error result is raised, not yielded as text."""
+        mock_popen.return_value = self._process(
+            ['{"type": "result", "is_error": true, "result": "Credit balance too low"}\n'],
+            returncode=1,
+        )
+
+        with pytest.raises(RuntimeError, match="Credit balance too low"):
+            list(call_claude_code_stream("Test prompt"))
+
+    @patch('ralph.prd.subprocess.Popen')
+    def test_not_found(self, mock_popen: MagicMock) -> None:
+        """Test Claude Code CLI not installed."""
+        mock_popen.side_effect = FileNotFoundError()
+
+        with pytest.raises(RuntimeError, match="Claude Code CLI not found"):
+            list(call_claude_code_stream("Test prompt"))
+
+
 @pytest.mark.e2e
 class TestPRDParserE2E:
     """End-to-end tests for PRD parsing with real Claude API."""
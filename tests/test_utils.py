@@ -0,0 +1,88 @@
+"""Tests for utility functions."""
+
+import json
+import stat
+import tempfile
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import patch
+
+import pytest
+
+from ralph import utils
+from ralph.utils import dump_prd, load_prd, read_prd
+
+SAMPLE_PRD = {
+    "project": "Café",
+    "phases": {"1": {"name": "Phase 1"}},
+    "userStories": [{"id": "US-001", "title": "Story", "status": "incomplete"}],
+    "metadata": {"totalStories": 1, "completedStories": 0},
+}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def json_backend(request: pytest.FixtureRequest) -> Iterator[bool]:
+    """Run a test with and without orjson."""
+    if request.param and not utils.HAS_ORJSON:
+        pytest.skip("orjson not installed")
+    with patch.object(utils, "HAS_ORJSON", request.param):
+        yield request.param
+
+
+class TestPRDSerialization:
+    """Tests for PRD read/dump helpers."""
+
+    def test_round_trip(self, json_backend: bool) -> None:
+        """Test that a dumped PRD reads back unchanged."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            dump_prd(SAMPLE_PRD, path)
+            assert read_prd(path) == SAMPLE_PRD
+
+    def test_dump_matches_stdlib_format(self, json_backend: bool) -> None:
+        """Test that output matches json.dump(indent=2) with unescaped unicode."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            dump_prd(SAMPLE_PRD, path)
+            expected = json.dumps(SAMPLE_PRD, indent=2, ensure_ascii=False)
+            assert path.read_text(encoding="utf-8") == expected
+
+    def test_dump_replaces_existing_file_atomically(self, json_backend: bool) -> None:
+        """Test that dump overwrites via rename and leaves no temp file behind."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            path.write_text('{"old": true}')
+            dump_prd(SAMPLE_PRD, path)
+            assert read_prd(path) == SAMPLE_PRD
+            assert [p.name for p in Path(tmpdir).iterdir()] == ["prd.json"]
+
+    def test_dump_preserves_file_mode(self, json_backend: bool) -> None:
+        """Test that rewriting a PRD keeps the existing file's permissions."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            path.write_text('{"old": true}')
+            path.chmod(0o600)
+            dump_prd(SAMPLE_PRD, path)
+            assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+    def test_dump_failure_keeps_original(self, json_backend: bool) -> None:
+        """Test that a failed dump leaves the previous PRD intact."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            path.write_text('{"old": true}')
+            with pytest.raises(TypeError):
+                dump_prd({"bad": object()}, path)
+            assert read_prd(path) == {"old": True}
+            assert [p.name for p in Path(tmpdir).iterdir()] == ["prd.json"]
+
+    def test_read_missing_file_raises(self, json_backend: bool) -> None:
+        """Test that read_prd raises for a missing file."""
+        with pytest.raises(FileNotFoundError):
+            read_prd(Path("/nonexistent/prd.json"))
+
+    def test_load_prd_invalid_json_returns_none(self, json_backend: bool) -> None:
+        """Test that load_prd returns None for invalid JSON."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prd.json"
+            path.write_text("{not json")
+            assert load_prd(path) is None